@@ -29,8 +29,8 @@ if __name__ == "__main__":
 
     # Setup UI based on the logged-in user's role
     setup_ui(root, conns, logged_in_user, auth_conn)
-    for conn in conns:
-        schedule_daily_backup(conn)
+    for db_name in db_names:
+        schedule_daily_backup(db_name)
 
     root.protocol("WM_DELETE_WINDOW", on_closing)
     root.mainloop()
@@ -0,0 +1,319 @@
+import datetime
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import pandas as pd
+from database import init_db, database_name, epoch_day, get_backup_rows, iter_frame_batches, iter_query_batches, count_query_rows
+from change_tracking import table_exists, bump_table_version
+
+ARCHIVE_DIR = "archives"
+ARCHIVE_COMPRESSION = "lzma"
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+RETENTION = {"daily": 7, "weekly": 4, "monthly": 12}
+BACKUP_ARCHIVE_AGE_DAYS = 90  # backup_data days older than this move to Parquet
+PARTITION_COMPRESSION = "zstd"
+
+# compression -> (file extension, open function, options used when writing)
+COMPRESSORS = {
+    "lzma": (".xz", lzma.open, {"preset": 6}),
+    "gzip": (".gz", gzip.open, {"compresslevel": 6}),
+}
+
+
+def archive_dir(db_name):
+    return os.path.join(ARCHIVE_DIR, db_name)
+
+
+def load_manifest(db_name):
+    path = os.path.join(archive_dir(db_name), "manifest.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(db_name, entries):
+    # Written beside the archives and swapped in, so a crash never leaves half a manifest
+    path = os.path.join(archive_dir(db_name), "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(ARCHIVE_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_archive(db_name, compression=ARCHIVE_COMPRESSION, progress=None, on_connect=None):
+    """
+    Write a compressed, checksummed snapshot of a database and record it in the manifest.
+
+    The snapshot is taken with VACUUM INTO, which gives a consistent and compacted
+    copy without blocking writers for long, then streamed through the compressor.
+    progress(bytes_done, bytes_total) is called per chunk and may raise to abort;
+    on_connect(conn) lets the caller hook conn.interrupt up to its cancel button.
+    Returns the manifest entry.
+    """
+    extension, opener, options = COMPRESSORS[compression]
+    os.makedirs(archive_dir(db_name), exist_ok=True)
+    created_at = datetime.datetime.now()
+    stamp = created_at.strftime('%Y%m%d-%H%M%S')
+    file_name = f"{db_name}-{stamp}.db{extension}"
+    suffix = 1
+    while os.path.exists(os.path.join(archive_dir(db_name), file_name)):
+        file_name = f"{db_name}-{stamp}-{suffix}.db{extension}"
+        suffix += 1
+    archive_path = os.path.join(archive_dir(db_name), file_name)
+    snapshot_path = archive_path + ".snapshot"
+
+    conn = init_db(db_name)
+    if on_connect:
+        on_connect(conn)
+    try:
+        conn.execute("VACUUM INTO ?", (snapshot_path,))
+    except BaseException:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)  # Interrupted part way
+        raise
+    finally:
+        conn.close()
+    try:
+        raw_size = os.path.getsize(snapshot_path)
+        done = 0
+        with open(snapshot_path, "rb") as source, opener(archive_path + ".tmp", "wb", **options) as target:
+            for chunk in iter(lambda: source.read(ARCHIVE_CHUNK_SIZE), b""):
+                target.write(chunk)
+                done += len(chunk)
+                if progress:
+                    progress(done, raw_size)
+        os.replace(archive_path + ".tmp", archive_path)
+    except BaseException:
+        if os.path.exists(archive_path + ".tmp"):
+            os.remove(archive_path + ".tmp")
+        raise
+    finally:
+        os.remove(snapshot_path)
+
+    entry = {
+        "file": file_name,
+        "created_at": created_at.isoformat(sep=" ", timespec="seconds"),
+        "compression": compression,
+        "raw_size": raw_size,
+        "size": os.path.getsize(archive_path),
+        "sha256": file_sha256(archive_path),
+    }
+    save_manifest(db_name, load_manifest(db_name) + [entry])
+    return entry
+
+
+def verify_archives(db_name):
+    """Re-hash every archive in the manifest; returns (file, ok, reason) for each."""
+    results = []
+    for entry in load_manifest(db_name):
+        path = os.path.join(archive_dir(db_name), entry["file"])
+        if not os.path.exists(path):
+            results.append((entry["file"], False, "missing"))
+        elif file_sha256(path) != entry["sha256"]:
+            results.append((entry["file"], False, "checksum mismatch"))
+        else:
+            results.append((entry["file"], True, "ok"))
+    return results
+
+
+def extract_archive(db_name, file_name, dest_path):
+    """Decompress an archive to dest_path after checking it against its recorded checksum."""
+    entry = next((entry for entry in load_manifest(db_name) if entry["file"] == file_name), None)
+    if entry is None:
+        raise ValueError(f"{file_name} is not in the archive manifest of {db_name}")
+    path = os.path.join(archive_dir(db_name), file_name)
+    if file_sha256(path) != entry["sha256"]:
+        raise ValueError(f"{file_name} does not match its recorded checksum")
+    _, opener, _ = COMPRESSORS[entry["compression"]]
+    with opener(path, "rb") as source, open(dest_path, "wb") as target:
+        shutil.copyfileobj(source, target, ARCHIVE_CHUNK_SIZE)
+    return dest_path
+
+
+def select_retained(entries, daily=RETENTION["daily"], weekly=RETENTION["weekly"], monthly=RETENTION["monthly"]):
+    """
+    Grandfather-father-son retention: keep the newest archive of each of the last
+    `daily` days, `weekly` ISO weeks and `monthly` months that have archives.
+    """
+    ordered = sorted(entries, key=lambda entry: entry["created_at"], reverse=True)
+    keep = set()
+    for count, period in ((daily, lambda moment: moment.date()),
+                          (weekly, lambda moment: moment.isocalendar()[:2]),
+                          (monthly, lambda moment: (moment.year, moment.month))):
+        seen = set()
+        for entry in ordered:
+            key = period(datetime.datetime.fromisoformat(entry["created_at"]))
+            if key not in seen and len(seen) < count:
+                seen.add(key)
+                keep.add(entry["file"])
+    return keep
+
+
+def prune_archives(db_name, **retention):
+    """Delete archives the retention policy no longer keeps; returns the removed file names."""
+    entries = load_manifest(db_name)
+    keep = select_retained(entries, **retention)
+    removed = [entry["file"] for entry in entries if entry["file"] not in keep]
+    save_manifest(db_name, [entry for entry in entries if entry["file"] in keep])
+    for file_name in removed:
+        path = os.path.join(archive_dir(db_name), file_name)
+        if os.path.exists(path):
+            os.remove(path)
+    return removed
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Archiving backup_data to Parquet needs pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+def partition_dir(db_name):
+    return os.path.join(archive_dir(db_name), "backup_data")
+
+
+def list_partitions(db_name, start_day=None, end_day=None):
+    """[(epoch_day, file_path)] of archived backup_data partitions, optionally limited to a day range."""
+    root = partition_dir(db_name)
+    if not os.path.isdir(root):
+        return []
+    partitions = []
+    for name in sorted(os.listdir(root)):
+        if not name.startswith("day="):
+            continue
+        day = epoch_day(name[len("day="):])
+        if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+            continue
+        folder = os.path.join(root, name)
+        partitions += [(day, os.path.join(folder, file_name))
+                       for file_name in sorted(os.listdir(folder)) if file_name.endswith(".parquet")]
+    return partitions
+
+
+def archive_backup_partitions(db_name, age_days=BACKUP_ARCHIVE_AGE_DAYS, progress=None, on_connect=None):
+    """
+    Move backup_data days older than age_days into Parquet files, one folder per day.
+
+    Rows of snapshots that later snapshots are still rebuilt from (the newest full
+    snapshot before the cutoff and everything after it) stay in the database. Each
+    day is written and then deleted inside one write transaction, so a row is never
+    in both places or in neither. on_connect is as for create_archive. Returns the
+    archived days as 'YYYY-MM-DD' strings.
+    """
+    pa, pq = _require_pyarrow()
+    cutoff = epoch_day(datetime.date.today()) - age_days
+    conn = init_db(db_name)
+    if on_connect:
+        on_connect(conn)
+    try:
+        if not table_exists(conn, "backup_data"):
+            return []
+        keep_from = 0
+        if table_exists(conn, "backup_snapshots"):
+            cutoff_date = datetime.date(1970, 1, 1) + datetime.timedelta(days=cutoff)
+            keep_from = conn.execute("SELECT max(id) FROM backup_snapshots WHERE kind='full' AND created_at < ?",
+                                     (cutoff_date.isoformat(),)).fetchone()[0] or 0
+        condition = '"Bkp_Day" = ? AND ("Bkp_Snapshot_Id" IS NULL OR "Bkp_Snapshot_Id" < ?)'
+        days = [row[0] for row in conn.execute(
+            'SELECT DISTINCT "Bkp_Day" FROM backup_data WHERE "Bkp_Day" < ? ORDER BY "Bkp_Day"', (cutoff,))]
+
+        archived = []
+        for index, day in enumerate(days):
+            day_text = (datetime.date(1970, 1, 1) + datetime.timedelta(days=day)).isoformat()
+            folder = os.path.join(partition_dir(db_name), f"day={day_text}")
+            path = os.path.join(folder, f"part-{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}.parquet")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                df = pd.read_sql_query(f"SELECT * FROM backup_data WHERE {condition}", conn, params=(day, keep_from))
+                if not df.empty:
+                    os.makedirs(folder, exist_ok=True)
+                    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path + ".tmp",
+                                   compression=PARTITION_COMPRESSION)
+                    os.replace(path + ".tmp", path)
+                    conn.execute(f"DELETE FROM backup_data WHERE {condition}", (day, keep_from))
+                    bump_table_version(conn.cursor(), "backup_data")
+                    snapshot_ids = df["Bkp_Snapshot_Id"].dropna().astype(int).unique().tolist() \
+                        if "Bkp_Snapshot_Id" in df else []
+                    conn.executemany("UPDATE backup_snapshots SET archived=1 WHERE id=?",
+                                     [(snapshot_id,) for snapshot_id in snapshot_ids])
+                    archived.append(day_text)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                for leftover in (path, path + ".tmp"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                raise
+            if progress:
+                progress(index + 1, len(days))
+        if keep_from:
+            # Snapshots before keep_from cannot be rebuilt any more, even those that wrote
+            # no rows of their own (e.g. an empty delta) and so were not marked above
+            conn.execute("UPDATE backup_snapshots SET archived=1 WHERE id < ? AND archived=0", (keep_from,))
+            conn.commit()
+        if archived:
+            # Hand the freed space back from the WAL; the main file reuses its free pages
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return archived
+    finally:
+        conn.close()
+
+
+def read_partitions(partitions, columns=None):
+    """Yield one DataFrame per archived partition file, reindexed to columns if given."""
+    if not partitions:
+        return
+    _, pq = _require_pyarrow()
+    for _, path in partitions:
+        df = pq.read_table(path).to_pandas()
+        yield df if columns is None else df.reindex(columns=columns)
+
+
+def query_backup_rows(conn, start_date, end_date):
+    """get_backup_rows plus any archived partitions the date range reaches into."""
+    live = get_backup_rows(conn, start_date, end_date)
+    db_name = database_name(conn)
+    frames = list(read_partitions(list_partitions(db_name, epoch_day(start_date), epoch_day(end_date)),
+                                  columns=list(live.columns)))
+    if not frames:
+        return live
+    return pd.concat(frames + [live], ignore_index=True)
+
+
+def iter_backup_batches(conn, columns=None):
+    """
+    (columns, rows) batches of all of backup_data: archived partitions first, then
+    the live table, so exports see the whole history without loading it at once.
+    """
+    projection = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+    live = iter_query_batches(conn, f'SELECT {projection} FROM backup_data')
+    header, rows = next(live)
+    for df in read_partitions(list_partitions(database_name(conn)), columns=header):
+        for batch in iter_frame_batches(df):
+            if batch[1]:
+                yield batch
+    yield header, rows
+    yield from live
+
+
+def count_backup_rows(conn):
+    total = count_query_rows(conn, "SELECT 1 FROM backup_data")
+    partitions = list_partitions(database_name(conn))
+    if partitions:
+        _, pq = _require_pyarrow()
+        total += sum(pq.ParquetFile(path).metadata.num_rows for _, path in partitions)
+    return total
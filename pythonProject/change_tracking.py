@@ -0,0 +1,181 @@
+import sqlite3
+import pandas as pd
+
+ROWID_COLUMN = "_rowid_"
+CHANGE_BATCH_SIZE = 500  # stays under SQLite's default bound-parameter limit
+# Tables whose writers move their table_versions counter themselves with bump_table_version,
+# as row triggers would cost too much on bulk loads
+COUNTED_TABLES = ("backup_data",)
+
+
+def table_exists(conn, table_name):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone() is not None
+
+
+def install_change_tracking(conn, table_name):
+    """
+    Create the per-table modification counter, the row change log and the triggers
+    that maintain both.
+
+    row_changes keeps one entry per rowid holding the counter value of its latest
+    insert, update or delete, so it stays bounded by the number of rows the table
+    has ever had while still answering "what changed since version N". Changes are
+    only complete back to table_versions.reset_version.
+    """
+    if not table_exists(conn, table_name):
+        return False
+    cursor = conn.cursor()
+    ensure_versions_table(cursor)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS row_changes (
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (table_name, row_id)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_row_changes_version ON row_changes (table_name, version)")
+    cursor.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)", (table_name,))
+    triggers_missing = False
+    for operation, row_refs in (("INSERT", ["NEW"]), ("UPDATE", ["OLD", "NEW"]), ("DELETE", ["OLD"])):
+        # An upsert rather than INSERT OR REPLACE: an ON CONFLICT clause on the statement that
+        # fires the trigger (an upsert into the tracked table) would override OR REPLACE in here.
+        log_rows = "\n".join(
+            f"""INSERT INTO row_changes (table_name, row_id, version)
+            VALUES ('{table_name}', {ref}.rowid,
+                    (SELECT version FROM table_versions WHERE table_name = '{table_name}'))
+            ON CONFLICT (table_name, row_id) DO UPDATE SET version = excluded.version;"""
+            for ref in row_refs
+        )
+        trigger_name = f"{table_name}_track_{operation.lower()}"
+        trigger_sql = f"""CREATE TRIGGER "{trigger_name}"
+        AFTER {operation} ON "{table_name}"
+        FOR EACH ROW
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE table_name = '{table_name}';
+            {log_rows}
+        END"""
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?", (trigger_name,))
+        existing = cursor.fetchone()
+        triggers_missing = triggers_missing or existing is None
+        if existing is None or existing[0] != trigger_sql:
+            # Only touch the schema when the trigger is missing or outdated
+            cursor.execute(f'DROP TRIGGER IF EXISTS "{trigger_name}"')
+            cursor.execute(trigger_sql)
+    if triggers_missing:
+        # The table is new, was replaced (DROP does not fire triggers) or was never tracked,
+        # so row_changes cannot describe how it got here. Start a new epoch that readers
+        # of the log (e.g. delta backups) must not reach back across.
+        cursor.execute("UPDATE table_versions SET version = version + 1, reset_version = version + 1 "
+                       "WHERE table_name=?", (table_name,))
+    conn.commit()
+    return True
+
+
+def ensure_versions_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        reset_version INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cursor.execute("PRAGMA table_info(table_versions)")
+    if "reset_version" not in [info[1] for info in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE table_versions ADD COLUMN reset_version INTEGER NOT NULL DEFAULT 0")
+
+
+def bump_table_version(cursor, table_name):
+    """Move the change counter of a COUNTED_TABLES table, inside the caller's write transaction."""
+    ensure_versions_table(cursor)
+    cursor.execute("INSERT INTO table_versions (table_name, version) VALUES (?, 1) "
+                   "ON CONFLICT (table_name) DO UPDATE SET version = version + 1", (table_name,))
+
+
+def tables_version(conn, table_names):
+    """
+    get_table_version of each table, as one hashable value for cache keys, or None if a
+    table has no counter to trust (neither tracking triggers nor a COUNTED_TABLES entry).
+    Views are skipped: the tables they read are listed as well.
+    """
+    views = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='view'")}
+    versions = []
+    for table_name in sorted(set(table_names) - views):
+        if table_name not in COUNTED_TABLES and not tracking_installed(conn, table_name):
+            return None
+        versions.append((table_name, get_table_version(conn, table_name)))
+    return tuple(versions)
+
+
+def tracking_installed(conn, table_name):
+    """True if all of table_name's tracking triggers exist; replacing the table drops them."""
+    names = [f"{table_name}_track_{operation}" for operation in ("insert", "update", "delete")]
+    count = conn.execute("SELECT count(*) FROM sqlite_master WHERE type='trigger' AND name IN (?, ?, ?)",
+                         names).fetchone()[0]
+    return count == len(names)
+
+
+def get_data_version(conn):
+    """Return PRAGMA data_version, which only moves when another connection commits."""
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def get_table_version(conn, table_name):
+    """
+    Return a cheap fingerprint of a table that changes whenever its contents change.
+
+    The fingerprint combines the schema cookie (bumped when the table is dropped or
+    replaced), the trigger-maintained modification counter and max(rowid), so an
+    unchanged table is checked with a handful of index lookups instead of a full read.
+    Returns None if the table does not exist.
+    """
+    if not table_exists(conn, table_name):
+        return None
+    cursor = conn.cursor()
+    schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+    try:
+        row = cursor.execute("SELECT version FROM table_versions WHERE table_name=?", (table_name,)).fetchone()
+        counter = row[0] if row else None
+    except sqlite3.OperationalError:
+        counter = None
+    max_rowid = cursor.execute(f'SELECT max(rowid) FROM "{table_name}"').fetchone()[0]
+    return schema_version, counter, max_rowid
+
+
+def get_reset_version(conn, table_name):
+    """Return the oldest version row_changes is complete from, or None if the table is untracked."""
+    try:
+        row = conn.execute("SELECT reset_version FROM table_versions WHERE table_name=?", (table_name,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def get_row_changes(conn, table_name, since_version):
+    """
+    Return (changed_df, deleted_ids) for rows touched after since_version.
+
+    changed_df holds the current contents of inserted and updated rows indexed by
+    rowid; deleted_ids lists rowids that no longer exist in the table.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT row_id FROM row_changes WHERE table_name=? AND version>? ORDER BY row_id",
+                   (table_name, since_version))
+    row_ids = [row[0] for row in cursor.fetchall()]
+
+    frames = []
+    for start in range(0, len(row_ids), CHANGE_BATCH_SIZE):
+        batch = row_ids[start:start + CHANGE_BATCH_SIZE]
+        placeholders = ", ".join(["?"] * len(batch))
+        frames.append(pd.read_sql_query(
+            f'SELECT rowid AS "{ROWID_COLUMN}", * FROM "{table_name}" WHERE rowid IN ({placeholders})',
+            conn, params=batch, index_col=ROWID_COLUMN))
+    if frames:
+        changed_df = pd.concat(frames)
+    else:
+        changed_df = pd.read_sql_query(f'SELECT rowid AS "{ROWID_COLUMN}", * FROM "{table_name}" LIMIT 0',
+                                       conn, index_col=ROWID_COLUMN)
+    deleted_ids = sorted(set(row_ids) - set(changed_df.index))
+    return changed_df, deleted_ids
@@ -1,6 +1,139 @@
 import sqlite3
 import pandas as pd
 import hashlib
+import json
+import os
+import re
+import datetime
+import time
+import pathlib
+import queue
+import threading
+from contextlib import contextmanager
+from change_tracking import install_change_tracking, bump_table_version, tables_version, ROWID_COLUMN
+from query_stream import QueryResult, QUERY_PAGE_SIZE, QUERY_TIMEOUT
+from query_cache import query_cache, normalize_sql, statement_tables, VOLATILE_SQL
+
+BULK_BATCH_SIZE = 10000
+READ_POOL_SIZE = 4  # idle read-only connections kept per database
+# Applied around bulk loads only. NORMAL is still crash-safe in WAL mode, unlike OFF.
+BULK_LOAD_PRAGMAS = {"synchronous": "NORMAL", "cache_size": -65536, "temp_store": "MEMORY"}
+ONLINE_BACKUP_PAGES = 2048  # pages copied per step of the online backup
+ONLINE_BACKUP_SLEEP = 0.05  # seconds between steps, so writers get the database in between
+# "full" keeps backup_data one complete copy of daily_data per day, which is what Reports and the
+# backup_data export show. "delta" is opt-in: it stores only changed rows ('U') and delete markers
+# ('D'), so those readers then see sparse rows; whole days come back through get_snapshot.
+BACKUP_MODE = "full"
+FULL_SNAPSHOT_INTERVAL = 30  # deltas between full snapshots, bounds the cost of a restore
+BACKUP_COLUMNS = ("Bkp_Date_time", "Bkp_Snapshot_Id", "Bkp_Row_Id", "Bkp_Op", "Bkp_Day")
+INTEGER_BACKUP_COLUMNS = ("Bkp_Snapshot_Id", "Bkp_Row_Id", "Bkp_Day")
+# Days since 1970-01-01 of a 'YYYY-MM-DD...' text value, matching epoch_day() below
+EPOCH_DAY_SQL = "CAST(julianday(substr({}, 1, 10)) - 2440587.5 AS INTEGER)"
+
+_read_pools = {}
+_read_pools_lock = threading.Lock()
+_version_watchers = {}  # db_name -> read-only connection that never commits itself
+
+def open_read_only(db_name):
+    """A connection that cannot write: opened through a mode=ro URI, with query_only as well."""
+    uri = pathlib.Path(f"{db_name}.db").absolute().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+def acquire_read_connection(db_name):
+    """Take a read-only connection from the pool of db_name, opening one if none is free."""
+    with _read_pools_lock:
+        pool = _read_pools.setdefault(db_name, queue.LifoQueue())
+    try:
+        return pool.get_nowait()
+    except queue.Empty:
+        return open_read_only(db_name)
+
+def release_read_connection(db_name, conn):
+    """Return a connection to the pool; beyond READ_POOL_SIZE idle connections it is closed."""
+    if conn.in_transaction:
+        conn.rollback()
+    pool = _read_pools[db_name]
+    if pool.qsize() < READ_POOL_SIZE:
+        pool.put(conn)
+    else:
+        conn.close()
+
+@contextmanager
+def read_connection(db_name):
+    """
+    Borrow a pooled read-only connection for reports, exports and ad-hoc queries.
+
+    In WAL mode readers never block the writer connections from init_db, and a
+    read-only connection cannot be used to modify data by accident.
+    """
+    conn = acquire_read_connection(db_name)
+    try:
+        yield conn
+    finally:
+        release_read_connection(db_name, conn)
+
+def database_version(db_name):
+    """
+    A counter that moves whenever any connection commits to db_name.
+
+    PRAGMA data_version is per connection, so it is always read from the same
+    dedicated connection, which only changes when someone else commits.
+    """
+    with _read_pools_lock:
+        if db_name not in _version_watchers:
+            _version_watchers[db_name] = open_read_only(db_name)
+        return _version_watchers[db_name].execute("PRAGMA data_version").fetchone()[0]
+
+def data_key(conn, db_name, tables):
+    """
+    Version part of a cache key for data read from tables: their table_versions counters,
+    so commits to other tables (logs, users) leave it alone. Falls back to the
+    database-wide data_version when a table has no counter to go by.
+    """
+    versions = tables_version(conn, tables) if tables is not None else None
+    return versions if versions is not None else ("data_version", database_version(db_name))
+
+def query_cache_key(db_name, query, params=(), conn=None):
+    """
+    Cache key for a result of query on db_name as the data stands now, or None if it must not be cached.
+    conn, if given, is used to find the tables query reads; otherwise a pooled connection is.
+    """
+    if VOLATILE_SQL.search(query):
+        return None
+    if conn is None:
+        with read_connection(db_name) as read_conn:
+            return query_cache_key(db_name, query, params, read_conn)
+    version = data_key(conn, db_name, statement_tables(conn, query, params))
+    return db_name, normalize_sql(query), tuple(params), version
+
+def read_frame_cached(db_name, key, tables, load):
+    """
+    load(conn) on a pooled read-only connection, served from query_cache while none of
+    tables has changed. key names what load reads (e.g. its function and arguments).
+    The frame may be shared, so callers must not modify it.
+    """
+    with read_connection(db_name) as conn:
+        cache_key = (db_name,) + tuple(key) + (data_key(conn, db_name, tables),)
+        df = query_cache.get(cache_key)
+        if df is None:
+            df = load(conn)
+            query_cache.put(cache_key, df, int(df.memory_usage(deep=True).sum()))
+    return df
+
+def read_sql_cached(db_name, query, params=()):
+    """
+    pd.read_sql_query on a pooled read-only connection, served from query_cache while
+    the tables it reads are unchanged. The frame may be shared, so callers must not modify it.
+    """
+    with read_connection(db_name) as conn:
+        key = query_cache_key(db_name, query, params, conn)
+        df = query_cache.get(key) if key else None
+        if df is None:
+            df = pd.read_sql_query(query, conn, params=params)
+            query_cache.put(key, df, int(df.memory_usage(deep=True).sum()))
+    return df
 
 def init_db(db_name):
     conn = sqlite3.connect(f"{db_name}.db", check_same_thread=False)
@@ -65,10 +198,14 @@ def add_default_admin_user(conn):
 def create_table_from_df(conn, df, table_name):
     df.to_sql(table_name, conn, if_exists='replace', index=False)
 
-def get_dataframe(conn, table_name):
-    query = f"SELECT * FROM {table_name}"
+def get_dataframe(conn, table_name, with_rowid=False):
+    if with_rowid:
+        # Index the frame by rowid so Treeview items and change-log entries share a key
+        query = f'SELECT rowid AS "{ROWID_COLUMN}", * FROM {table_name}'
+    else:
+        query = f"SELECT * FROM {table_name}"
     try:
-        df = pd.read_sql_query(query, conn)
+        df = pd.read_sql_query(query, conn, index_col=ROWID_COLUMN if with_rowid else None)
         if df.empty:
             return None
         return df
@@ -76,75 +213,457 @@ def get_dataframe(conn, table_name):
         print(f"Error fetching data from {table_name}: {e}")
         return None
 
-def backup_data(conn):
-    cursor = conn.cursor()
-
-    cursor.execute("PRAGMA table_info(daily_data)")
-    columns_info = cursor.fetchall()
-    columns = [info[1] for info in columns_info]
-
+def ensure_backup_table(cursor, columns):
+    """Create backup_data and the snapshot manifest, or migrate older layouts up to date."""
     cursor.execute("PRAGMA table_info(backup_data)")
     existing_columns_info = cursor.fetchall()
     existing_columns = [info[1] for info in existing_columns_info]
+    columns = [backup_column(col) for col in columns]
 
     if not existing_columns:
         columns_def = ", ".join([f'"{col}" TEXT' for col in columns])
         create_table_query = f"""
             CREATE TABLE IF NOT EXISTS backup_data (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                {columns_def},
-                "Bkp_Date_time" TEXT
+                {columns_def + ',' if columns_def else ''}
+                "Bkp_Date_time" TEXT,
+                "Bkp_Snapshot_Id" INTEGER,
+                "Bkp_Row_Id" INTEGER,
+                "Bkp_Op" TEXT,
+                "Bkp_Day" INTEGER
             )
         """
         cursor.execute(create_table_query)
+    else:
+        for col in list(columns) + list(BACKUP_COLUMNS):
+            if col not in existing_columns:
+                col_type = "INTEGER" if col in INTEGER_BACKUP_COLUMNS else "TEXT"
+                cursor.execute(f'ALTER TABLE backup_data ADD COLUMN "{col}" {col_type}')
+        if "Bkp_Day" not in existing_columns:
+            # One-off backfill for databases created before Bkp_Day existed
+            day_expression = EPOCH_DAY_SQL.format('"Bkp_Date_time"')
+            cursor.execute(f'UPDATE backup_data SET "Bkp_Day" = {day_expression} WHERE "Bkp_Date_time" IS NOT NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_backup_data_snapshot '
+                   'ON backup_data ("Bkp_Snapshot_Id", "Bkp_Row_Id")')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_backup_data_day ON backup_data ("Bkp_Day")')
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS backup_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        columns TEXT NOT NULL,
+        row_id_column TEXT,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        archived INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cursor.execute("PRAGMA table_info(backup_snapshots)")
+    if "archived" not in [info[1] for info in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE backup_snapshots ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+
+def epoch_day(value):
+    """Integer day number (days since 1970-01-01) of a date, datetime or 'YYYY-MM-DD...' string."""
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value.strip()[:10])
+    elif isinstance(value, datetime.datetime):
+        value = value.date()
+    return (value - datetime.date(1970, 1, 1)).days
+
+def backup_column(col):
+    """Name a data column gets in backup_data; names backup_data uses itself get a prefix."""
+    return f"Bkp_Orig_{col}" if col == "id" or col in BACKUP_COLUMNS else col
 
-    columns_str = ", ".join([f'"{col}"' for col in columns])
-    delete_query = f'DELETE FROM backup_data WHERE DATE("Bkp_Date_time") = DATE("now", "localtime")'
-    cursor.execute(delete_query)
+def rowid_alias(cursor, table_name):
+    """Return the INTEGER PRIMARY KEY column that aliases rowid, or None."""
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    primary_keys = [info for info in cursor.fetchall() if info[5]]
+    if len(primary_keys) == 1 and primary_keys[0][2].upper() == "INTEGER":
+        return primary_keys[0][1]
+    return None
 
-    insert_query = f"""
-        INSERT INTO backup_data ({columns_str}, "Bkp_Date_time")
-        SELECT {columns_str}, DATETIME('now', 'localtime') FROM daily_data
+def backup_data(conn, mode=BACKUP_MODE):
     """
-    cursor.execute(insert_query)
-    conn.commit()
+    Snapshot daily_data into backup_data and record it in backup_snapshots.
 
-def insert_backup_data(conn, df, date_time):
+    In "delta" mode only rows inserted, updated or deleted since the previous
+    snapshot are written (Bkp_Op 'U' with the row's contents, or 'D'), read from the
+    change-tracking log. A full copy is taken instead for the first snapshot, after
+    the table was replaced or its columns changed, and every FULL_SNAPSHOT_INTERVAL
+    deltas so that restores stay cheap. "full" mode always copies the whole table
+    and, like the old daily copy, replaces snapshots already taken today.
+    Returns (snapshot_id, kind, rows_written).
+    """
+    if not install_change_tracking(conn, "daily_data"):
+        raise ValueError("daily_data does not exist")
     cursor = conn.cursor()
+    row_id_column = rowid_alias(cursor, "daily_data")
+    cursor.execute("PRAGMA table_info(daily_data)")
+    columns = [info[1] for info in cursor.fetchall() if info[1] != row_id_column]
+    ensure_backup_table(cursor, columns)
+    conn.commit()
 
-    columns = df.columns.tolist()
-    cursor.execute("PRAGMA table_info(backup_data)")
-    existing_columns_info = cursor.fetchall()
-    existing_columns = [info[1] for info in existing_columns_info]
+    # Hold the write lock from reading the version to the last insert, so no change
+    # can fall between this snapshot and the next one.
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        if mode == "full":
+            delete_snapshots(cursor, "date(created_at) = date('now', 'localtime')")
+        version, reset_version = cursor.execute(
+            "SELECT version, reset_version FROM table_versions WHERE table_name='daily_data'").fetchone()
+        last = cursor.execute("SELECT id, version, columns FROM backup_snapshots WHERE table_name='daily_data' "
+                              "ORDER BY id DESC LIMIT 1").fetchone()
+        kind = "delta"
+        if mode == "full" or last is None or last[1] < reset_version or json.loads(last[2]) != columns:
+            kind = "full"
+        else:
+            cursor.execute("SELECT count(*) FROM backup_snapshots WHERE table_name='daily_data' AND id > "
+                           "(SELECT max(id) FROM backup_snapshots WHERE table_name='daily_data' AND kind='full')")
+            if cursor.fetchone()[0] >= FULL_SNAPSHOT_INTERVAL:
+                kind = "full"
 
-    if not existing_columns:
-        columns_def = ", ".join([f'"{col}" TEXT' for col in columns])
-        create_table_query = f"""
-            CREATE TABLE IF NOT EXISTS backup_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                {columns_def},
-                "Bkp_Date_time" TEXT
-            )
-        """
-        cursor.execute(create_table_query)
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute("INSERT INTO backup_snapshots (table_name, kind, version, columns, row_id_column, created_at) "
+                       "VALUES ('daily_data', ?, ?, ?, ?, ?)", (kind, version, json.dumps(columns), row_id_column, now))
+        snapshot_id = cursor.lastrowid
 
-    columns_str = ", ".join([f'"{col}"' for col in columns])
-    for _, row in df.iterrows():
-        values = tuple(row) + (date_time,)
-        placeholders = ", ".join(["?"] * len(values))
-        insert_query = f"""
-            INSERT INTO backup_data ({columns_str}, "Bkp_Date_time")
-            VALUES ({placeholders})
-        """
-        cursor.execute(insert_query, values)
+        day = epoch_day(now)
+        target = ", ".join([f'"{backup_column(col)}"' for col in columns] + ['"Bkp_Date_time"', '"Bkp_Day"',
+                                                              '"Bkp_Snapshot_Id"', '"Bkp_Row_Id"', '"Bkp_Op"'])
+        source = ", ".join([f'd."{col}"' for col in columns] + ["?", "?", "?", "d.rowid", "'U'"])
+        if kind == "full":
+            cursor.execute(f"INSERT INTO backup_data ({target}) SELECT {source} FROM daily_data d",
+                           (now, day, snapshot_id))
+            rows_written = cursor.rowcount
+        else:
+            since = last[1]
+            cursor.execute(f"""
+                INSERT INTO backup_data ({target})
+                SELECT {source} FROM row_changes c JOIN daily_data d ON d.rowid = c.row_id
+                WHERE c.table_name = 'daily_data' AND c.version > ?
+            """, (now, day, snapshot_id, since))
+            rows_written = cursor.rowcount
+            cursor.execute("""
+                INSERT INTO backup_data ("Bkp_Date_time", "Bkp_Day", "Bkp_Snapshot_Id", "Bkp_Row_Id", "Bkp_Op")
+                SELECT ?, ?, ?, c.row_id, 'D' FROM row_changes c
+                WHERE c.table_name = 'daily_data' AND c.version > ?
+                  AND NOT EXISTS (SELECT 1 FROM daily_data d WHERE d.rowid = c.row_id)
+            """, (now, day, snapshot_id, since))
+            rows_written += cursor.rowcount
+        cursor.execute("UPDATE backup_snapshots SET row_count=? WHERE id=?", (rows_written, snapshot_id))
+        bump_table_version(cursor, "backup_data")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return snapshot_id, kind, rows_written
+
+def delete_snapshots(cursor, condition, params=()):
+    """Delete the manifest entries matching condition together with their backup_data rows."""
+    cursor.execute(f"SELECT id FROM backup_snapshots WHERE {condition}", params)
+    snapshot_ids = [row[0] for row in cursor.fetchall()]
+    for snapshot_id in snapshot_ids:
+        cursor.execute('DELETE FROM backup_data WHERE "Bkp_Snapshot_Id" = ?', (snapshot_id,))
+        cursor.execute("DELETE FROM backup_snapshots WHERE id = ?", (snapshot_id,))
+    if snapshot_ids:
+        bump_table_version(cursor, "backup_data")
+    return snapshot_ids
+
+def database_name(conn):
+    """The name init_db was called with, taken from the main database file of conn."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.splitext(os.path.basename(path))[0]
+
+def get_backup_rows(conn, start_date, end_date):
+    """backup_data rows stamped between two dates, inclusive, as an index range scan on Bkp_Day."""
+    return pd.read_sql_query('SELECT * FROM backup_data WHERE "Bkp_Day" BETWEEN ? AND ? ORDER BY id',
+                             conn, params=(epoch_day(start_date), epoch_day(end_date)))
+
+def online_backup(conn, file_path, pages=ONLINE_BACKUP_PAGES, sleep=ONLINE_BACKUP_SLEEP, progress=None):
+    """
+    Copy the live database to file_path with SQLite's online backup API.
+
+    The copy is made `pages` pages at a time with a pause between steps, so the source
+    is only locked briefly at each step. progress(status, remaining, total) is called
+    after every step and may raise to abort. The destination is always closed.
+    """
+    dest = sqlite3.connect(file_path)
+    try:
+        conn.backup(dest, pages=pages, progress=progress, sleep=sleep)
+    finally:
+        dest.close()
+
+def list_snapshots(conn, table_name="daily_data"):
+    return pd.read_sql_query("SELECT id, kind, version, row_count, created_at, archived FROM backup_snapshots "
+                             "WHERE table_name=? ORDER BY id", conn, params=(table_name,))
+
+def snapshot_query(cursor, snapshot_id):
+    """
+    Build the query that rebuilds the table as it was at snapshot_id.
+
+    It starts from the newest full snapshot at or before snapshot_id and keeps, for
+    every row, the latest entry of the deltas on top of it; rows whose latest entry
+    is a delete are dropped. Returns (query, params, table_name, columns, row_id_column);
+    the query yields the original rowid as ROWID_COLUMN, then row_id_column, then columns.
+    """
+    manifest = cursor.execute("SELECT table_name, columns, row_id_column, archived FROM backup_snapshots WHERE id=?",
+                              (snapshot_id,)).fetchone()
+    if manifest is None:
+        raise ValueError(f"Snapshot {snapshot_id} does not exist")
+    table_name, columns, row_id_column, archived = manifest
+    if archived:
+        raise ValueError(f"Snapshot {snapshot_id} has been moved to the Parquet archive")
+    columns = json.loads(columns)
+    base_id, base_archived = cursor.execute(
+        "SELECT id, archived FROM backup_snapshots WHERE table_name=? AND kind='full' AND id<=? ORDER BY id DESC LIMIT 1",
+        (table_name, snapshot_id)).fetchone() or (None, None)
+    if base_id is None:
+        raise ValueError(f"Snapshot {snapshot_id} has no full snapshot to be rebuilt from")
+    if base_archived:
+        raise ValueError(f"The full snapshot {base_id} that snapshot {snapshot_id} is rebuilt from "
+                         f"has been moved to the Parquet archive")
+    selected = [f'b."Bkp_Row_Id" AS "{ROWID_COLUMN}"']
+    if row_id_column:
+        selected.append(f'b."Bkp_Row_Id" AS "{row_id_column}"')
+    selected += [f'b."{backup_column(col)}" AS "{col}"' for col in columns]
+    query = f"""
+        SELECT {", ".join(selected)}
+        FROM backup_data b
+        JOIN (SELECT max(id) AS last_id FROM backup_data
+              WHERE "Bkp_Snapshot_Id" IN (SELECT id FROM backup_snapshots
+                                          WHERE table_name = ? AND id BETWEEN ? AND ?)
+              GROUP BY "Bkp_Row_Id") latest ON b.id = latest.last_id
+        WHERE b."Bkp_Op" = 'U'
+        ORDER BY b."Bkp_Row_Id"
+    """
+    return query, (table_name, base_id, snapshot_id), table_name, columns, row_id_column
+
+def get_snapshot(conn, snapshot_id):
+    """Rebuild the table as it was at snapshot_id, indexed by its original rowid."""
+    query, params, _, _, _ = snapshot_query(conn.cursor(), snapshot_id)
+    return pd.read_sql_query(query, conn, params=params, index_col=ROWID_COLUMN)
+
+def diff_snapshot(conn, snapshot_id):
+    """
+    Compare a snapshot with the live table, by rowid.
+
+    Returns a DataFrame of the rows a restore would touch, with a "Change" column of
+    'add' (back from the snapshot), 'remove' (not in the snapshot) or 'change'; the
+    values shown are the snapshot's, or the live row's for removals. Values are
+    compared as text because backup_data stores them as text.
+    """
+    snapshot = get_snapshot(conn, snapshot_id)
+    _, _, table_name, _, _ = snapshot_query(conn.cursor(), snapshot_id)
+    live = get_dataframe(conn, table_name, with_rowid=True)
+    if live is None:
+        live = snapshot.iloc[0:0]
+    columns = [col for col in snapshot.columns if col in live.columns]
+
+    def as_text(df):
+        values = df[columns].astype(object).where(df[columns].notna(), None)
+        return values.apply(lambda column: column.map(lambda value: None if value is None else str(value)))
+
+    added = snapshot.loc[~snapshot.index.isin(live.index)].assign(Change="add")
+    removed = live.loc[~live.index.isin(snapshot.index)].assign(Change="remove")
+    common = snapshot.index.intersection(live.index)
+    snapshot_text, live_text = as_text(snapshot.loc[common]), as_text(live.loc[common])
+    differs = ~((snapshot_text == live_text) | (snapshot_text.isna() & live_text.isna())).all(axis=1)
+    changed = snapshot.loc[common[differs.to_numpy()]].assign(Change="change")
+    frames = [frame for frame in (added, removed, changed) if not frame.empty]
+    if not frames:
+        return snapshot.iloc[0:0].assign(Change=None)
+    return pd.concat(frames).sort_index()
+
+def restore_snapshot(conn, snapshot_id):
+    """
+    Replace the live table with a snapshot in two set-based steps.
+
+    The snapshot is first built with one INSERT ... SELECT into a staging table, then
+    swapped in by DROP + RENAME in a single short transaction, so readers (the tab's
+    own refresh included) see either the old table or the restored one, never a mix.
+    Indexes and triggers are recreated, and change tracking starts a new epoch, so
+    the next delta backup becomes a full one. Returns the number of rows restored.
+    """
+    cursor = conn.cursor()
+    query, params, table_name, columns, row_id_column = snapshot_query(cursor, snapshot_id)
+    staging = f"{table_name}_restore"
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    table_sql = cursor.fetchone()
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    live_columns = [info[1] for info in cursor.fetchall()]
+    expected = ([row_id_column] if row_id_column else []) + columns
+
+    cursor.execute(f'DROP TABLE IF EXISTS "{staging}"')
+    if table_sql and set(expected) <= set(live_columns):
+        # Keep the live table's column types, defaults and keys
+        cursor.execute(re.sub(r'^CREATE TABLE\s+("[^"]+"|\[[^\]]+\]|\S+)', f'CREATE TABLE "{staging}"',
+                              table_sql[0], count=1, flags=re.IGNORECASE))
+    else:
+        # The table has changed shape since the snapshot; restore the snapshot's shape
+        columns_def = ", ".join(([f'"{row_id_column}" INTEGER PRIMARY KEY'] if row_id_column else [])
+                                + [f'"{col}"' for col in columns])
+        cursor.execute(f'CREATE TABLE "{staging}" ({columns_def})')
+    target = ", ".join([f'"{row_id_column}"' if row_id_column else "rowid"] + [f'"{col}"' for col in columns])
+    source = ", ".join([f'"{ROWID_COLUMN}"'] + [f'"{col}"' for col in columns])
+    cursor.execute(f'INSERT INTO "{staging}" ({target}) SELECT {source} FROM ({query})', params)
+    restored = cursor.rowcount
     conn.commit()
 
-def execute_query(conn, query):
+    cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name=? AND type IN ('index', 'trigger') "
+                   "AND sql IS NOT NULL AND name NOT LIKE ?", (table_name, f"{table_name}_track_%"))
+    dependents = [row[0] for row in cursor.fetchall()]
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(f'DROP TABLE "{table_name}"')
+        cursor.execute(f'ALTER TABLE "{staging}" RENAME TO "{table_name}"')
+        for sql in dependents:
+            cursor.execute(sql)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        cursor.execute(f'DROP TABLE IF EXISTS "{staging}"')
+        conn.commit()
+        raise
+    install_change_tracking(conn, table_name)
+    return restored
+
+def insert_backup_data(conn, df, date_time, batch_size=BULK_BATCH_SIZE, tuned_pragmas=False, progress=None):
+    """Bulk-load a DataFrame into backup_data; returns (rows_written, rows_per_second)."""
+    return insert_backup_batches(conn, iter_frame_batches(df, batch_size), date_time,
+                                 tuned_pragmas=tuned_pragmas, progress=progress)
+
+def iter_frame_batches(df, batch_size=BULK_BATCH_SIZE):
+    """
+    Yield (columns, rows) from a DataFrame as plain tuples, with NaN as None and timestamps as text.
+
+    An empty frame still yields one batch with no rows, so writers can emit a header.
+    """
+    columns = [str(col) for col in df.columns]
+    values = df.astype(object).where(df.notna(), None)
+    if len(values) == 0:
+        yield columns, []
+    for start in range(0, len(values), batch_size):
+        chunk = values.iloc[start:start + batch_size]
+        yield columns, [tuple(map(to_sql_value, row)) for row in chunk.itertuples(index=False, name=None)]
+
+def iter_query_batches(conn, query, params=(), batch_size=BULK_BATCH_SIZE):
+    """Yield (columns, rows) for a query with fetchmany, so only one batch is ever held in memory."""
     cursor = conn.cursor()
-    cursor.execute(query)
+    cursor.execute(query, params)
     columns = [desc[0] for desc in cursor.description]
-    result = cursor.fetchall()
-    return pd.DataFrame(result, columns=columns)
+    rows = cursor.fetchmany(batch_size)
+    yield columns, rows
+    while rows:
+        rows = cursor.fetchmany(batch_size)
+        if rows:
+            yield columns, rows
+    cursor.close()
+
+def count_query_rows(conn, query, params=()):
+    return conn.execute(f"SELECT count(*) FROM ({query})", params).fetchone()[0]
+
+def to_sql_value(value):
+    # sqlite3's implicit datetime adapters are deprecated, so store ISO text like the rest of the app
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+@contextmanager
+def bulk_load_pragmas(conn, enabled=True):
+    """Temporarily apply BULK_LOAD_PRAGMAS, restoring the previous values afterwards."""
+    if not enabled:
+        yield
+        return
+    previous = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in BULK_LOAD_PRAGMAS}
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+def insert_backup_batches(conn, batches, date_time, tuned_pragmas=False, progress=None):
+    """
+    Write (columns, rows) batches into backup_data inside a single transaction.
+
+    The INSERT is prepared once and each batch goes through executemany, so memory
+    is bounded by one batch however large the source is. progress, if given, is
+    called with (rows_written, rows_per_second) after every batch.
+    Returns (rows_written, rows_per_second).
+    """
+    cursor = conn.cursor()
+    insert_query = None
+    date_time = to_sql_value(date_time)
+    stamp = (date_time, epoch_day(date_time) if date_time else None)
+    rows_written = 0
+    started = time.perf_counter()
+    with bulk_load_pragmas(conn, tuned_pragmas):
+        try:
+            for columns, rows in batches:
+                if insert_query is None:
+                    ensure_backup_table(cursor, columns)
+                    columns_str = ", ".join([f'"{backup_column(col)}"' for col in columns])
+                    placeholders = ", ".join(["?"] * (len(columns) + 2))
+                    insert_query = (f'INSERT INTO backup_data ({columns_str}, "Bkp_Date_time", "Bkp_Day") '
+                                    f'VALUES ({placeholders})')
+                cursor.executemany(insert_query, (row + stamp for row in rows))
+                rows_written += len(rows)
+                if progress:
+                    progress(rows_written, rows_written / max(time.perf_counter() - started, 1e-6))
+            if insert_query is not None:
+                bump_table_version(cursor, "backup_data")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return rows_written, rows_written / max(time.perf_counter() - started, 1e-6)
+
+def save_row_changes(conn, table_name, rows_df, deleted_ids):
+    """
+    Persist edited and deleted rows of a rowid-indexed DataFrame in one transaction.
+
+    Edited rows are written with UPDATE ... WHERE rowid=? and deleted rows removed by
+    rowid, so the table (and its id/date_column defaults and change-tracking triggers)
+    is left in place. The rowid alias column (e.g. id) is never written, and a row
+    someone else deleted in the meantime is not brought back: its rowid is returned
+    in the list of rows that no longer exist.
+    """
+    cursor = conn.cursor()
+    alias = rowid_alias(cursor, table_name)
+    columns = [col for col in rows_df.columns if str(col) != alias]
+    assignments = ", ".join([f'"{col}"=?' for col in columns])
+    update_query = f'UPDATE "{table_name}" SET {assignments} WHERE rowid=?'
+    values = rows_df[columns].astype(object).where(rows_df[columns].notna(), None)
+    missing = []
+    try:
+        if columns:
+            for row_id, row in zip(values.index, values.itertuples(index=False, name=None)):
+                cursor.execute(update_query, tuple(map(to_sql_value, row)) + (int(row_id),))
+                if cursor.rowcount == 0:
+                    missing.append(row_id)
+        cursor.executemany(f'DELETE FROM "{table_name}" WHERE rowid=?', ((int(row_id),) for row_id in deleted_ids))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return missing
+
+def execute_query(conn, query, params=(), page_size=QUERY_PAGE_SIZE, timeout=QUERY_TIMEOUT, release=None,
+                  use_cache=True):
+    """
+    Run an ad-hoc statement and return a QueryResult to page through, instead of fetching everything.
+
+    Call it on a worker thread with a connection of its own, normally one from
+    acquire_read_connection; release(conn) is called once the result is done with it.
+    With use_cache, a result read to the end is kept in query_cache and repeats of
+    the statement are answered from it until a table it reads changes.
+    """
+    cache_key = query_cache_key(database_name(conn), query, params, conn) if use_cache else None
+    return QueryResult(query, params, page_size, timeout).execute(conn, release=release, cache_key=cache_key)
 
 def create_logs_table():
     conn = sqlite3.connect('user_management.db')
@@ -176,7 +695,12 @@ def create_logs_table():
 create_logs_table()
 
 def get_table_hash(conn, table_name):
-    """Compute a hash of the entire table."""
+    """
+    Compute a hash of the entire table.
+
+    This reads every row, so use it only as an on-demand consistency check; polling
+    should go through change_tracking.get_table_version instead.
+    """
     query = f"SELECT * FROM {table_name}"
     df = pd.read_sql_query(query, conn)
     table_str = df.to_string().encode('utf-8')
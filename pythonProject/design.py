@@ -3,6 +3,10 @@ from logic import *
 import tkinter as tk
 from auth import add_user, update_user, delete_user, log_action
 from database import init_db
+from change_tracking import install_change_tracking
+from ui_dispatch import UIDispatcher
+from jobs import JobRunner
+from tab_model import TabModel
 import sqlite3
 
 def setup_ui(root, db_names, user, theme=None):
@@ -19,6 +23,10 @@ def setup_ui(root, db_names, user, theme=None):
         Exception: If a database connection fails or a UI component fails to initialize.
     """
     try:
+        root.ui_dispatcher = UIDispatcher(root)
+        root.jobs = JobRunner(root)
+        root.jobs.add_listener(lambda job: update_status_bar(root, job.describe()))
+        root.jobs.add_listener(lambda job: update_progress_bar(root, job))
         configure_styles(theme)
         notebook, tabs, last_timestamps = create_notebook_and_tabs(root, db_names, user)
         setup_menu_bar(root)
@@ -130,6 +138,10 @@ def setup_status_bar(root):
     status_bar = Label(root, text="Last Updated: Never", bd=1, relief="sunken", anchor="w")
     status_bar.pack(side="bottom", fill="x")
     root.status_bar = status_bar
+    # Shows the progress of the most recently reporting background job
+    progress_bar = ttk.Progressbar(root, mode="determinate", maximum=100)
+    progress_bar.pack(side="bottom", fill="x")
+    root.progress_bar = progress_bar
 
 def setup_log_window(root):
     """
@@ -249,6 +261,7 @@ def setup_tab(root, tab, db_name, user):
 '''
 def setup_tab(root, tab, db_name, user):
     conn = init_db(db_name)
+    install_change_tracking(conn, "daily_data")
 
     data_frame = ttk.Frame(tab)
     data_frame.pack(fill='both', expand=True)
@@ -256,15 +269,19 @@ def setup_tab(root, tab, db_name, user):
     tree.pack(fill='both', expand=True)
     # Store the treeview in the tab
     tab.tree = tree
+    tab.db_name = db_name
+    # The model is the single source of truth for the tab; the tree only renders it
+    tab.model = TabModel()
 
     # Load data from "daily_data" table and display it
-    df = get_dataframe(conn, "daily_data")
+    with read_connection(db_name) as read_conn:
+        df = get_dataframe(read_conn, "daily_data", with_rowid=True)
     if df is not None:
-        df = df.fillna('')  # Ensure NaN values are replaced with empty strings
+        tab.model.load(df)
         display_df_in_treeview(tree, df)
-        tab.treeview_df = df  # Store the dataframe as well
 
     tree.bind('<Double-1>', lambda event: on_double_click(event, tree, conn, user))
+    tree.bind('<Delete>', lambda event: delete_selected_rows(tree))
 
     button_frame = ttk.Frame(tab)
     button_frame.pack(fill='x', pady=10)
@@ -281,11 +298,11 @@ def setup_tab(root, tab, db_name, user):
     save_button.pack(side="left", padx=5)
 
     backup_button = ttk.Button(button_frame, text="Save to Backup",
-                               command=lambda: backup_data_handler(root, conn, user))
+                               command=lambda: backup_data_handler(root, tab, conn, user))
     backup_button.pack(side="left", padx=5)
 
     import_button = ttk.Button(button_frame, text="Import Data",
-                               command=lambda: log_and_execute(import_data_handler, root, conn,
+                               command=lambda: log_and_execute(import_data_handler, root, tab, conn,
                                                                action_description="Imported Data", user=user))
     import_button.pack(side="left", padx=5)
 
@@ -295,15 +312,28 @@ def setup_tab(root, tab, db_name, user):
     query_button.pack(side="left", padx=5)
 
     download_button = ttk.Button(button_frame, text="Download Backup",
-                                 command=lambda: log_and_execute(download_backup, conn,
+                                 command=lambda: log_and_execute(download_backup, tab,
                                                                  action_description="Downloaded Backup", user=user))
     download_button.pack(side="left", padx=5)
 
     excel_button = ttk.Button(button_frame, text="Download in Excel",
-                              command=lambda: log_and_execute(download_excel, conn,
+                              command=lambda: log_and_execute(download_excel, tree,
                                                               action_description="Downloaded in Excel", user=user))
     excel_button.pack(side="left", padx=5)
 
+    export_button = ttk.Button(button_frame, text="Export...",
+                               command=lambda: log_and_execute(open_export_window, tree,
+                                                               action_description="Opened Export", user=user))
+    export_button.pack(side="left", padx=5)
+
+    archive_button = ttk.Button(button_frame, text="Archive",
+                                command=lambda: archive_handler(root, tab, conn, user))
+    archive_button.pack(side="left", padx=5)
+
+    restore_button = ttk.Button(button_frame, text="Restore",
+                                command=lambda: open_restore_window(tab, conn, user))
+    restore_button.pack(side="left", padx=5)
+
     report_button = ttk.Button(button_frame, text="Reports", command=lambda: log_and_execute(open_report_window, conn,
                                                                                              action_description="Opened Reports",
                                                                                              user=user))
@@ -324,6 +354,14 @@ def setup_admin_ui(root, conn):
     admin_menu.add_cascade(label="Logs", menu=log_menu)
     log_menu.add_command(label="View Logs", command=lambda: open_view_logs_window(root, conn))
 
+    jobs_menu = Menu(admin_menu, tearoff=0)
+    admin_menu.add_cascade(label="Jobs", menu=jobs_menu)
+    jobs_menu.add_command(label="View Jobs", command=lambda: open_jobs_window(root))
+
+    archive_menu = Menu(admin_menu, tearoff=0)
+    admin_menu.add_cascade(label="Archives", menu=archive_menu)
+    archive_menu.add_command(label="Verify Archives", command=lambda: verify_archives_handler(root))
+
 
 def setup_login_screen(root, authenticate_callback):
     root.title("Login")
@@ -493,5 +531,38 @@ def open_view_logs_window(root, conn):
         tree.insert("", "end", values=log_row)
 
 
+def open_jobs_window(root):
+    top = Toplevel(root)
+    top.title("Jobs")
+
+    tree = ttk.Treeview(top)
+    tree.pack(fill='both', expand=True)
+    tree["columns"] = ("ID", "Job", "Tab", "Status", "Progress")
+    tree["show"] = "headings"
+    for col in tree["columns"]:
+        tree.heading(col, text=col)
+
+    def show_job(job):
+        values = (job.id, job.name, job.tab_name, job.status, job.describe())
+        if tree.exists(str(job.id)):
+            tree.item(str(job.id), values=values)
+        else:
+            tree.insert("", "end", iid=str(job.id), values=values)
+
+    for job in root.jobs.jobs:
+        show_job(job)
+    root.jobs.add_listener(show_job)
+    top.bind("<Destroy>", lambda event: root.jobs.remove_listener(show_job) if event.widget is top else None)
+
+    def cancel_selected():
+        selected = {int(item) for item in tree.selection()}
+        for job in root.jobs.jobs:
+            if job.id in selected:
+                job.cancel()
+
+    cancel_button = ttk.Button(top, text="Cancel Selected", command=cancel_selected)
+    cancel_button.pack(pady=5)
+
+
 def logout(root, conn):
     root.destroy()
@@ -0,0 +1,90 @@
+import openpyxl
+import pandas as pd
+from database import to_sql_value
+
+EXCEL_BATCH_SIZE = 5000
+
+
+def iter_excel_batches(file_path, batch_size=EXCEL_BATCH_SIZE):
+    """
+    Yield (columns, rows) for the first sheet of a workbook, batch_size rows at a time.
+
+    .xlsx files are read lazily with openpyxl in read-only mode, so only one batch of
+    plain tuples is in memory at once. Legacy .xls files cannot be streamed and are
+    read through pandas, then batched the same way. A sheet with a header and no
+    data rows still yields (columns, []) once, as iter_frame_batches does.
+    """
+    if file_path.lower().endswith(".xls"):
+        df = pd.read_excel(file_path)
+        df = df.astype(object).where(df.notna(), None)
+        columns = [str(col) for col in df.columns]
+        if df.empty:
+            yield columns, []
+        for start in range(0, len(df), batch_size):
+            yield columns, [tuple(map(to_sql_value, row)) for row in df.iloc[start:start + batch_size].itertuples(index=False)]
+        return
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+        width = len(columns)
+        batch = []
+        yielded = False
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            row = tuple(to_sql_value(value) for value in row[:width])
+            batch.append(row + (None,) * (width - len(row)))
+            if len(batch) >= batch_size:
+                yield columns, batch
+                yielded = True
+                batch = []
+        if batch or not yielded:
+            yield columns, batch
+    finally:
+        workbook.close()
+
+
+def read_excel_streaming(file_path, batch_size=EXCEL_BATCH_SIZE, progress=None):
+    """Build a DataFrame from a workbook batch by batch instead of through the full openpyxl object model."""
+    columns = None
+    frames = []
+    rows_read = 0
+    for columns, batch in iter_excel_batches(file_path, batch_size):
+        frames.append(pd.DataFrame(batch, columns=columns))
+        rows_read += len(batch)
+        if progress:
+            progress(rows_read)
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_xlsx_stream(file_path, batches, total=None, progress=None):
+    """
+    Write (columns, rows) batches to an .xlsx file with openpyxl's write-only mode.
+
+    Write-only worksheets serialise each appended row straight to a temporary
+    file, so peak memory stays flat at any row count. The header comes from the
+    first batch. progress, if given, is called with (rows_written, total).
+    Returns the number of data rows written.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    header_written = False
+    rows_written = 0
+    for columns, rows in batches:
+        if not header_written:
+            sheet.append(columns)
+            header_written = True
+        for row in rows:
+            sheet.append(row)
+        rows_written += len(rows)
+        if progress:
+            progress(rows_written, total)
+    workbook.save(file_path)
+    return rows_written
@@ -0,0 +1,113 @@
+import bz2
+import csv
+import gzip
+import lzma
+from excel_stream import write_xlsx_stream
+
+# Compression choices per format; None means uncompressed. xlsx is a zip container already.
+EXPORT_FORMATS = {
+    "xlsx": {"extension": ".xlsx", "label": "Excel files", "compressions": [None]},
+    "csv": {"extension": ".csv", "label": "CSV files", "compressions": [None, "gzip", "bz2", "xz"]},
+    "parquet": {"extension": ".parquet", "label": "Parquet files",
+                "compressions": ["snappy", None, "gzip", "zstd", "lz4", "brotli"]},
+    "feather": {"extension": ".feather", "label": "Feather files", "compressions": ["lz4", None, "zstd"]},
+}
+
+CSV_OPENERS = {None: open, "gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+CSV_SUFFIXES = {None: "", "gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+
+def export_extension(fmt, compression=None):
+    suffix = CSV_SUFFIXES.get(compression, "") if fmt == "csv" else ""
+    return EXPORT_FORMATS[fmt]["extension"] + suffix
+
+
+def export_batches(file_path, fmt, batches, total=None, progress=None, compression=None):
+    """
+    Write (columns, rows) batches to file_path in the given format and return the row count.
+
+    Every writer consumes the batches as they arrive, so an export of any size only
+    holds one batch in memory. progress, if given, is called with (rows_written, total).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if compression not in EXPORT_FORMATS[fmt]["compressions"]:
+        raise ValueError(f"{fmt} export does not support {compression} compression")
+    if fmt == "xlsx":
+        return write_xlsx_stream(file_path, batches, total=total, progress=progress)
+    if fmt == "csv":
+        return write_csv_stream(file_path, batches, total=total, progress=progress, compression=compression)
+    return write_arrow_stream(file_path, fmt, batches, total=total, progress=progress, compression=compression)
+
+
+def write_csv_stream(file_path, batches, total=None, progress=None, compression=None):
+    rows_written = 0
+    with CSV_OPENERS[compression](file_path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        header_written = False
+        for columns, rows in batches:
+            if not header_written:
+                writer.writerow(columns)
+                header_written = True
+            writer.writerows(rows)
+            rows_written += len(rows)
+            if progress:
+                progress(rows_written, total)
+    return rows_written
+
+
+def write_arrow_stream(file_path, fmt, batches, total=None, progress=None, compression=None):
+    """
+    Write batches as Parquet row groups or Feather (Arrow IPC) record batches.
+
+    The schema is inferred from the first batch; columns that are empty there are
+    written as strings. pyarrow is only needed for these two formats.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import pyarrow.ipc as ipc
+    except ImportError:
+        raise RuntimeError("Parquet and Feather export need pyarrow (pip install pyarrow)")
+
+    writer = None
+    schema = None
+    rows_written = 0
+    try:
+        for columns, rows in batches:
+            values = list(zip(*rows)) if rows else [()] * len(columns)
+            if schema is None:
+                schema = pa.schema([pa.field(name, _infer_type(pa, column)) for name, column in zip(columns, values)])
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(file_path, schema, compression=compression or "none")
+                else:
+                    options = ipc.IpcWriteOptions(compression=compression)
+                    writer = ipc.new_file(file_path, schema, options=options)
+            arrays = [_to_array(pa, field, column) for field, column in zip(schema, values)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows_written += len(rows)
+            if progress:
+                progress(rows_written, total)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows_written
+
+
+def _infer_type(pa, values):
+    try:
+        inferred = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed types in one column (SQLite allows it); keep everything as text
+        return pa.string()
+    return pa.string() if pa.types.is_null(inferred) else inferred
+
+
+def _to_array(pa, field, values):
+    try:
+        return pa.array(values, type=field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if pa.types.is_string(field.type):
+            return pa.array([None if value is None else str(value) for value in values], type=field.type)
+        raise ValueError(f"Column '{field.name}' changes type part way through the data "
+                         f"({field.type} expected); export it as CSV or Excel instead")
@@ -0,0 +1,203 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+MAX_JOB_WORKERS = 4
+MAX_FINISHED_JOBS = 50  # finished jobs kept for the jobs panel; older ones are dropped
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+
+class Job:
+    """A unit of background work as seen by the jobs panel and the status bar."""
+
+    def __init__(self, runner, job_id, name, tab_name):
+        self.runner = runner
+        self.id = job_id
+        self.name = name
+        self.tab_name = tab_name
+        self.status = "Queued"
+        self.done = 0
+        self.total = None
+        self.message = ""
+        self.token = CancelToken()
+        self._cancel_hooks = []
+        self._hooks_lock = threading.Lock()
+
+    def report(self, done, total=None, message=""):
+        """Record progress from the worker; raises JobCancelled if the job was cancelled."""
+        self.token.raise_if_cancelled()
+        self.done = done
+        self.total = total
+        self.message = message
+        self.runner._notify(self)
+
+    def on_cancel(self, callback):
+        """
+        Call callback (e.g. conn.interrupt or QueryResult.cancel) when the job is cancelled,
+        so SQLite work that never calls report() still stops. Runs at once if already cancelled.
+        """
+        with self._hooks_lock:
+            if not self.token.cancelled:
+                self._cancel_hooks.append(callback)
+                return
+        self._run_hook(callback)
+
+    def remove_cancel_hook(self, callback):
+        with self._hooks_lock:
+            if callback in self._cancel_hooks:
+                self._cancel_hooks.remove(callback)
+
+    def cancel(self):
+        with self._hooks_lock:
+            self.token.cancel()
+            hooks, self._cancel_hooks = self._cancel_hooks, []
+        for callback in hooks:
+            self._run_hook(callback)
+
+    @staticmethod
+    def _run_hook(callback):
+        try:
+            callback()
+        except Exception as e:
+            # e.g. interrupting a connection the work has already closed
+            print(f"Cancel hook failed: {e}")
+
+    def describe(self):
+        if self.total:
+            progress = f"{100 * self.done / self.total:.0f}%"
+        elif self.done:
+            progress = str(self.done)
+        else:
+            progress = ""
+        return " ".join(part for part in (f"{self.name}:", self.status, progress, self.message) if part)
+
+
+class JobRunner:
+    """
+    Thread pool for long tab operations.
+
+    work(job) runs on a worker thread and must not touch widgets; it reports
+    progress through job.report() and should call it often enough for cancellation
+    to take effect; work that blocks inside SQLite registers job.on_cancel(conn.interrupt)
+    instead. on_done(result) and on_error(exc) run on the Tk thread via
+    root.ui_dispatcher, as does on_cancel() when the job is cancelled, queued or
+    running, so callers can undo any "busy" state they set. Jobs submitted for the
+    same tab are mutually exclusive: a second job is refused while the first holds
+    the tab lock. Only the newest MAX_FINISHED_JOBS finished jobs stay in self.jobs.
+    """
+
+    def __init__(self, root, max_workers=MAX_JOB_WORKERS):
+        self.root = root
+        self.jobs = []
+        self._jobs_lock = threading.Lock()
+        self.listeners = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._tab_locks = {}
+        self._running_on_tab = {}
+        self._ids = itertools.count(1)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def submit(self, name, work, tab=None, tab_name="", on_done=None, on_error=None, on_cancel=None):
+        lock = None
+        if tab is not None:
+            lock = self._tab_locks.setdefault(tab, threading.Lock())
+            if not lock.acquire(blocking=False):
+                running = self._running_on_tab.get(tab)
+                messagebox.showwarning("Busy", f"'{running.name if running else 'Another job'}' is still running "
+                                               f"on this tab. Wait for it to finish or cancel it first.")
+                return None
+
+        job = Job(self, next(self._ids), name, tab_name)
+        with self._jobs_lock:
+            self.jobs.append(job)
+        if tab is not None:
+            self._running_on_tab[tab] = job
+        self._notify(job)
+        self._executor.submit(self._run, job, work, tab, lock, on_done, on_error, on_cancel)
+        return job
+
+    def cancel_all(self):
+        for job in self.jobs:
+            if job.status in ("Queued", "Running"):
+                job.cancel()
+
+    def shutdown(self):
+        """Cancel everything and drop queued jobs; called when the app closes."""
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, work, tab, lock, on_done, on_error, on_cancel):
+        try:
+            job.token.raise_if_cancelled()
+            job.status = "Running"
+            self._notify(job)
+            result = work(job)
+            job.status = "Done"
+            if on_done:
+                self.root.ui_dispatcher.post(None, on_done, result)
+        except JobCancelled:
+            self._cancelled(job, on_cancel)
+        except Exception as e:
+            if job.token.cancelled:
+                # An interrupted SQLite call surfaces as an error; it is just the cancel taking effect
+                self._cancelled(job, on_cancel)
+                return
+            job.status = "Failed"
+            job.message = str(e)
+            self.root.ui_dispatcher.post(None, on_error or self._show_error, e)
+        finally:
+            if tab is not None:
+                self._running_on_tab.pop(tab, None)
+                lock.release()
+            self._notify(job)
+            self._prune_finished()
+
+    def _prune_finished(self):
+        # A new list rather than in-place removal, so the Tk thread can iterate self.jobs meanwhile
+        with self._jobs_lock:
+            finished = [job for job in self.jobs if job.status not in ("Queued", "Running")]
+            if len(finished) > MAX_FINISHED_JOBS:
+                dropped = set(finished[:len(finished) - MAX_FINISHED_JOBS])
+                self.jobs = [job for job in self.jobs if job not in dropped]
+
+    def _cancelled(self, job, on_cancel):
+        job.status = "Cancelled"
+        if on_cancel:
+            self.root.ui_dispatcher.post(None, on_cancel)
+
+    def _show_error(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def _notify(self, job):
+        # Coalesced per job, so rapid progress reports cost one widget update per frame
+        self.root.ui_dispatcher.post(("job", job.id), self._call_listeners, job)
+
+    def _call_listeners(self, job):
+        for callback in list(self.listeners):
+            callback(job)
@@ -1,32 +1,168 @@
 import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, Entry, Toplevel, simpledialog
-from database import create_table_from_df, get_dataframe, backup_data, insert_backup_data, execute_query, init_db, get_table_hash
+from database import (create_table_from_df, get_dataframe, backup_data,
+                      insert_backup_batches, save_row_changes, iter_frame_batches, iter_query_batches, count_query_rows,
+                      list_snapshots, diff_snapshot, restore_snapshot, online_backup,
+                      database_name, init_db, open_read_only, read_connection, acquire_read_connection,
+                      release_read_connection, query_cache_key, read_sql_cached, read_frame_cached,
+                      rowid_alias, epoch_day)
+from change_tracking import (install_change_tracking, tracking_installed, get_data_version, get_table_version,
+                             get_row_changes, ROWID_COLUMN)
 import datetime
+import os
 import threading
 import time
 import sqlite3
 from auth import login, log_action
+from virtual_grid import VirtualGrid, VIRTUAL_THRESHOLD
+from excel_stream import iter_excel_batches, read_excel_streaming
+from export_formats import EXPORT_FORMATS, export_batches, export_extension
+from tab_model import TabModel, view_rows
+from scheduler import BackupScheduler
+from jobs import JobCancelled
+from query_stream import QueryResult, QueryCancelled, QUERY_TIMEOUT, PROFILE_STEPS, format_query_plan
+from archive import (create_archive, prune_archives, verify_archives, archive_backup_partitions, query_backup_rows,
+                     list_partitions, iter_backup_batches, count_backup_rows)
+
+RENDER_CHUNK_SIZE = 250  # rows inserted per Tk event-loop slice during progressive loads
+RESTORE_PREVIEW_ROWS = 1000
+QUERY_PREFETCH_AT = 0.9  # fetch the next page once the view shows past this fraction of the loaded rows
+
 def load_excel(tree):
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls")])
     if file_path:
-        df = pd.read_excel(file_path)
-        df = df.fillna('')
-        display_df_in_treeview(tree, df)
+        tab = tree.master.master
+        root = tab.master.master
+
+        def work(job):
+            return read_excel_streaming(file_path, progress=lambda count: job.report(count, message="rows read"))
+
+        def done(df):
+            tab.model.load(df)
+            # Render in slices on the Tk event loop; a refresh of this tab supersedes it
+            root.ui_dispatcher.post(("refresh", tab), render_df_in_treeview, tree, df)
+
+        root.jobs.submit("Load Excel", work, tab=tab, tab_name=tab.db_name, on_done=done)
 
 def display_df_in_treeview(tree, df):
-    tree.delete(*tree.get_children())
+    for _ in render_df_in_treeview(tree, df, chunk_size=max(len(df), 1)):
+        pass
+
+def render_df_in_treeview(tree, df, chunk_size=RENDER_CHUNK_SIZE):
+    """
+    Fill the tree from df, yielding after every chunk_size rows.
+
+    Driven by root.ui_dispatcher the yields let the Tk event loop run between
+    chunks, and posting a newer refresh for the same tab closes the generator,
+    cancelling the rest of the load. Progress goes to the status bar.
+    """
+    root = tree.master.master.master.master
+    grid = getattr(tree, 'virtual_grid', None)
+    if grid is None:
+        tree.delete(*tree.get_children())
     tree["column"] = list(df.columns)
     tree["show"] = "headings"
     for col in tree["column"]:
         tree.heading(col, text=col)
-    df_rows = df.to_numpy().tolist()
-    for row in df_rows:
-        tree.insert("", "end", values=row)
-    for col in tree["column"]:
-        tree.heading(col, text=col)
+
+    if len(df) > VIRTUAL_THRESHOLD:
+        # Large tabs only ever render the visible window of rows
+        if grid is None:
+            grid = tree.virtual_grid = VirtualGrid(tree)
+        grid.set_data(df)
+    else:
+        if grid is not None:
+            grid.detach()
+            tree.virtual_grid = None
+        total = len(df)
+        for start in range(0, total, chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
+            for item_id, row in zip(chunk.index, view_rows(chunk)):
+                tree.insert("", "end", iid=str(item_id), values=row)
+            if start + chunk_size < total:
+                update_status_bar(root, f"Loading rows {start + len(chunk)}/{total}...")
+                yield
+    tree.view_stale = False
     tree.pack(fill='both', expand=True)
     add_summary(tree, df)
+
+def can_reconcile(tree, old_df, new_df):
+    """Reconciliation needs both frames keyed by rowid, the same columns and a tree that shows old_df."""
+    if old_df is None or getattr(tree, 'virtual_grid', None) is not None:
+        return False
+    if getattr(tree, 'view_stale', False):
+        return False
+    if old_df.index.name != ROWID_COLUMN or new_df.index.name != ROWID_COLUMN:
+        return False
+    if list(old_df.columns) != list(new_df.columns) or len(new_df) > VIRTUAL_THRESHOLD:
+        return False
+    return len(tree.get_children()) == len(old_df)
+
+def reconcile_treeview(tree, old_df, new_df, chunk_size=RENDER_CHUNK_SIZE):
+    """
+    Bring a tree that shows old_df in line with new_df, reusing item IDs.
+
+    Rows are matched by rowid and compared column-wise in one vectorized pass, so
+    only deleted, changed and inserted rows cost Tcl calls; selection and scroll
+    position of untouched items are kept. Yields every chunk_size operations.
+    """
+    removed = old_df.index.difference(new_df.index)
+    added = new_df.index.difference(old_df.index)
+    common = old_df.index.intersection(new_df.index)
+
+    old_common = old_df.loc[common]
+    new_common = new_df.loc[common]
+    same = (old_common == new_common) | (old_common.isna() & new_common.isna())
+    changed = common[~same.all(axis=1).to_numpy()]
+
+    operations = 0
+    if len(removed):
+        tree.delete(*[str(row_id) for row_id in removed])
+    for row_id, row in zip(changed, view_rows(new_df.loc[changed])):
+        tree.item(str(row_id), values=row)
+        operations += 1
+        if operations % chunk_size == 0:
+            yield
+    # Insert in ascending target position so every earlier position is already final
+    positions = new_df.index.get_indexer(added)
+    for position, row_id, row in sorted(zip(positions, added, view_rows(new_df.loc[added]))):
+        tree.insert("", int(position), iid=str(row_id), values=row)
+        operations += 1
+        if operations % chunk_size == 0:
+            yield
+    tree.view_stale = False
+    add_summary(tree, new_df)
+
+def apply_row_changes(tree, model, changed_df, deleted_ids, chunk_size=RENDER_CHUNK_SIZE):
+    """
+    Merge a row delta into the tab model and patch only the affected Treeview items.
+
+    Deleted rowids are removed, existing ones get their values replaced and new ones
+    are appended, so the selection and scroll position survive a refresh. Like
+    reconcile_treeview it yields every chunk_size item updates. In virtual-grid
+    mode the visible window is simply re-rendered from the model.
+    """
+    updated, inserted, deleted = model.apply_changes(changed_df, deleted_ids)
+    grid = getattr(tree, 'virtual_grid', None)
+    if grid is not None:
+        grid.set_data(model.df, keep_position=True)
+    else:
+        if deleted:
+            tree.delete(*[str(row_id) for row_id in deleted])
+        operations = 0
+        for row_id, row in zip(updated.index, view_rows(updated)):
+            tree.item(str(row_id), values=row)
+            operations += 1
+            if operations % chunk_size == 0:
+                yield
+        for row_id, row in zip(inserted.index, view_rows(inserted)):
+            tree.insert("", "end", iid=str(row_id), values=row)
+            operations += 1
+            if operations % chunk_size == 0:
+                yield
+    add_summary(tree, model.df)
+
 def add_summary(tree, df):
     # Clear any existing summary frame
     for child in tree.master.winfo_children():
@@ -38,73 +174,309 @@ def add_summary(tree, df):
     summary_frame.pack(fill='x', pady=5)
 
     # Add summary labels to the frame
-    for col in df.columns:
-        total = df[col].sum() if pd.api.types.is_numeric_dtype(df[col]) else len(df[col])
+    for col, total in TabModel(df).summary():
         label = ttk.Label(summary_frame, text=f"{col} Total: {total}")
         label.pack(side="left", padx=5)
 
 def save_to_db(tree, conn, user):
-    try:
-        data = []
-        for row_id in tree.get_children():
-            row = tree.item(row_id)['values']
-            data.append(row)
-        df = pd.DataFrame(data, columns=tree["column"])
-        df.to_sql("daily_data", conn, if_exists='replace', index=False)
+    tab = tree.master.master
+    root = tab.master.master
+    if tab.model.is_from_database:
+        save_dirty_rows(root, tab, conn, user)
+        return
+    if tab.model.df is None:
+        update_status_bar(root, "Nothing to save")
+        return
+    # Data that did not come from daily_data (e.g. a freshly loaded workbook) replaces the table
+    df = tab.model.to_frame()
+
+    def work(job):
+        worker_conn = init_db(tab.db_name)
+        job.on_cancel(worker_conn.interrupt)
+        try:
+            df.to_sql("daily_data", worker_conn, if_exists='replace', index=False)
+            install_change_tracking(worker_conn, "daily_data")
+        finally:
+            worker_conn.close()
+
+    def done(_):
+        tab.model.mark_saved(set(tab.model.dirty_rows), set(tab.model.deleted_rows))
         log_action(user[0], user[1], "Saved to Database", conn)
-        update_status_bar(tree.master.master.master.master, "Data saved to database successfully!")
-    except Exception as e:
+        update_status_bar(root, "Data saved to database successfully!")
+
+    def failed(e):
         messagebox.showerror("Error", str(e))
         log_action(user[0], user[1], f"Failed to Save Database: {str(e)}", conn)
 
+    root.jobs.submit("Save to Database", work, tab=tab, tab_name=tab.db_name, on_done=done, on_error=failed)
+
+
+
+def save_dirty_rows(root, tab, conn, user):
+    """Save only the rows edited or deleted since the last save, as one transaction of UPDATEs and DELETEs."""
+    if not tab.model.has_unsaved_edits:
+        update_status_bar(root, "No changes to save")
+        return
+    rows_df, deleted = tab.model.pending_changes()
+
+    def work(job):
+        worker_conn = init_db(tab.db_name)
+        job.on_cancel(worker_conn.interrupt)
+        try:
+            return save_row_changes(worker_conn, "daily_data", rows_df, deleted)
+        finally:
+            worker_conn.close()
+
+    def done(missing):
+        tab.model.mark_saved(rows_df.index, deleted)
+        log_action(user[0], user[1], f"Saved to Database ({len(rows_df) - len(missing)} updated, "
+                                     f"{len(deleted)} deleted)", conn)
+        if missing:
+            # Deleted by someone else since this tab loaded them; the next refresh drops them
+            tab.reload_requested = True
+            update_status_bar(root, f"Data saved; {len(missing)} edited row(s) had been deleted meanwhile "
+                                    f"and were not saved")
+        else:
+            update_status_bar(root, "Data saved to database successfully!")
+
+    def failed(e):
+        messagebox.showerror("Error", str(e))
+        log_action(user[0], user[1], f"Failed to Save Database: {str(e)}", conn)
+
+    root.jobs.submit("Save to Database", work, tab=tab, tab_name=tab.db_name, on_done=done, on_error=failed)
+
+def has_unsaved_edits(tab):
+    return hasattr(tab, 'model') and tab.model.has_unsaved_edits
 
+def item_label(tree, item_id):
+    """Map a Treeview item to its DataFrame index label (rowid for data loaded from daily_data)."""
+    grid = getattr(tree, 'virtual_grid', None)
+    if grid is not None:
+        return grid.row_label(item_id)
+    return int(item_id)
+
+def delete_selected_rows(tree):
+    tab = tree.master.master
+    selection = tree.selection()
+    if tab.model.df is None or not selection:
+        return
+    labels = [item_label(tree, item_id) for item_id in selection]
+    tab.model.delete_rows(labels)
+    grid = getattr(tree, 'virtual_grid', None)
+    if grid is not None:
+        grid.set_data(tab.model.df, keep_position=True)
+    else:
+        tree.delete(*selection)
+    add_summary(tree, tab.model.df)
+    update_status_bar(tab.master.master, f"{len(labels)} row(s) marked for deletion")
 
 def generate_report(conn, start_date=None, end_date=None):
     query = "SELECT * FROM daily_data"
+    params = ()
     if start_date and end_date:
-        query += f" WHERE date_column BETWEEN '{start_date}' AND '{end_date}'"
-    summary_df = pd.read_sql_query(query, conn)
+        query += " WHERE date_column BETWEEN ? AND ?"
+        params = (start_date, end_date)
+    summary_df = read_sql_cached(database_name(conn), query, params)
     summary = summary_df.describe(include='all')
     summary_text = summary.to_string()
     messagebox.showinfo("Report", summary_text)
 
-def download_excel(tree):
+def open_report_window(conn):
+    top = Toplevel()
+    top.title("Generate Report")
+
+    start_label = ttk.Label(top, text="Start Date (YYYY-MM-DD):")
+    start_label.pack(pady=5)
+    start_entry = ttk.Entry(top)
+    start_entry.pack(pady=5)
+
+    end_label = ttk.Label(top, text="End Date (YYYY-MM-DD):")
+    end_label.pack(pady=5)
+    end_entry = ttk.Entry(top)
+    end_entry.pack(pady=5)
+
+    generate_button = ttk.Button(top, text="Generate Report",
+                                 command=lambda: generate_report_with_filter(conn, start_entry.get(), end_entry.get(), top))
+    generate_button.pack(pady=20)
+
+def generate_report_with_filter(conn, start_date, end_date, top):
     try:
-        data = []
-        for row_id in tree.get_children():
-            row = tree.item(row_id)['values']
-            data.append(row)
-        df = pd.DataFrame(data, columns=tree["column"])
-        file_path = filedialog.asksaveasfilename(defaultextension=".xlsx",
-                                                 filetypes=[("Excel files", "*.xlsx;*.xls")])
-        if file_path:
-            df.to_excel(file_path, index=False)
-            update_status_bar(tree.master.master.master.master, "Data downloaded as Excel successfully!")
+        db_name = database_name(conn)
+        # Archived partitions are part of the key, so files moved or removed by hand are noticed too
+        partitions = tuple(list_partitions(db_name, epoch_day(start_date), epoch_day(end_date)))
+        df = read_frame_cached(db_name, ("query_backup_rows", start_date, end_date, partitions), ["backup_data"],
+                               lambda read_conn: query_backup_rows(read_conn, start_date, end_date))
+        if not df.empty:
+            report_window = Toplevel(top)
+            report_window.title("Report")
+            tree = ttk.Treeview(report_window)
+            tree.pack(fill='both', expand=True)
+            tree["columns"] = list(df.columns)
+            tree["show"] = "headings"
+            for col in tree["columns"]:
+                tree.heading(col, text=col)
+            for row in view_rows(df):
+                tree.insert("", "end", values=row)
+        else:
+            messagebox.showinfo("No Data", "No data available for the selected date range.")
     except Exception as e:
         messagebox.showerror("Error", str(e))
 
+EXPORT_SOURCES = ("daily_data", "backup_data")
+
+def download_excel(tree):
+    tab = tree.master.master
+    if tab.model.df is None:
+        update_status_bar(tab.master.master, "Nothing to download")
+        return
+    file_path = filedialog.asksaveasfilename(defaultextension=".xlsx",
+                                             filetypes=[("Excel files", "*.xlsx;*.xls")])
+    if file_path:
+        export_data(tab, "daily_data", None, "xlsx", None, file_path)
+
+def export_columns(tab, source):
+    if source == "daily_data":
+        return tab.model.columns
+    conn = tab.master.master.tabs[tab]
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{source}")')]
+
+def export_data(tab, source, columns, fmt, compression, file_path):
+    """
+    Export a table of the tab's database as a background job.
+
+    columns=None exports every column. daily_data with unsaved edits, or a loaded
+    workbook that has not been saved yet, is exported from the tab model so the file
+    matches the screen; everything else streams from SQLite with fetchmany.
+    """
+    root = tab.master.master
+    model = tab.model
+    df = None
+    if source == "daily_data" and not (model.is_from_database and not model.has_unsaved_edits):
+        df = model.to_frame()
+        if columns is not None:
+            df = df[columns]
+
+    def work(job):
+        progress = lambda count, total: job.report(count, total, "rows written")
+        if df is not None:
+            return export_batches(file_path, fmt, iter_frame_batches(df), total=len(df),
+                                  progress=progress, compression=compression)
+        worker_conn = acquire_read_connection(tab.db_name)
+        # Pooled connection: the hook must be gone before another job can borrow it
+        job.on_cancel(worker_conn.interrupt)
+        try:
+            if source == "backup_data":
+                # Includes the days already moved out to the Parquet archive
+                return export_batches(file_path, fmt, iter_backup_batches(worker_conn, columns),
+                                      total=count_backup_rows(worker_conn), progress=progress,
+                                      compression=compression)
+            projection = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+            query = f'SELECT {projection} FROM "{source}"'
+            return export_batches(file_path, fmt, iter_query_batches(worker_conn, query),
+                                  total=count_query_rows(worker_conn, query), progress=progress,
+                                  compression=compression)
+        finally:
+            job.remove_cancel_hook(worker_conn.interrupt)
+            release_read_connection(tab.db_name, worker_conn)
+
+    root.jobs.submit(f"Export {source} as {fmt}", work, tab=tab, tab_name=tab.db_name,
+                     on_done=lambda rows: update_status_bar(root, f"Exported {rows} rows of {source} to {file_path}"))
+
+def open_export_window(tree):
+    tab = tree.master.master
+    top = Toplevel()
+    top.title("Export Data")
+
+    ttk.Label(top, text="Source:").pack(pady=(10, 0))
+    source_box = ttk.Combobox(top, values=EXPORT_SOURCES, state="readonly")
+    source_box.set(EXPORT_SOURCES[0])
+    source_box.pack(pady=5)
+
+    ttk.Label(top, text="Columns (none selected exports all):").pack()
+    column_list = tk.Listbox(top, selectmode="multiple", exportselection=False, height=10)
+    column_list.pack(fill='both', expand=True, padx=10, pady=5)
+
+    ttk.Label(top, text="Format:").pack()
+    format_box = ttk.Combobox(top, values=list(EXPORT_FORMATS), state="readonly")
+    format_box.set("csv")
+    format_box.pack(pady=5)
+
+    ttk.Label(top, text="Compression:").pack()
+    compression_box = ttk.Combobox(top, state="readonly")
+    compression_box.pack(pady=5)
+
+    def fill_columns(event=None):
+        column_list.delete(0, 'end')
+        try:
+            columns = export_columns(tab, source_box.get())
+        except sqlite3.Error:
+            columns = []
+        for col in columns:
+            column_list.insert('end', col)
+
+    def fill_compressions(event=None):
+        choices = [name or "none" for name in EXPORT_FORMATS[format_box.get()]["compressions"]]
+        compression_box.config(values=choices)
+        compression_box.set(choices[0])
+
+    def export():
+        source = source_box.get()
+        fmt = format_box.get()
+        compression = None if compression_box.get() == "none" else compression_box.get()
+        columns = [column_list.get(i) for i in column_list.curselection()] or None
+        if source == "daily_data" and tab.model.df is None:
+            messagebox.showinfo("No Data", "No data available to export.")
+            return
+        extension = export_extension(fmt, compression)
+        file_path = filedialog.asksaveasfilename(parent=top, defaultextension=extension,
+                                                 filetypes=[(EXPORT_FORMATS[fmt]["label"], f"*{extension}")])
+        if file_path:
+            export_data(tab, source, columns, fmt, compression, file_path)
+            top.destroy()
+
+    source_box.bind("<<ComboboxSelected>>", fill_columns)
+    format_box.bind("<<ComboboxSelected>>", fill_compressions)
+    fill_columns()
+    fill_compressions()
+    ttk.Button(top, text="Export", command=export).pack(pady=10)
+
+def update_progress_bar(root, job):
+    progress_bar = getattr(root, "progress_bar", None)
+    if progress_bar is None:
+        return
+    if job.status == "Running" and job.total:
+        progress_bar["value"] = 100 * job.done / job.total
+    elif job.status != "Running":
+        progress_bar["value"] = 0
+
 def update_status_bar(root, message):
     status_bar = root.status_bar
     status_bar.config(text=f"Last Updated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
 
-def schedule_daily_backup(db_name):
-    def daily_backup():
-        while True:
-            conn = init_db(db_name)  # Reinitialize connection within the thread
-            backup_data(conn)
-            conn.close()
-            time.sleep(86400)  # 24 hours in seconds
+def start_backup_scheduler(root, db_names, schedules=None):
+    """Start scheduled backups for db_names; schedules maps a db name to a cron expression."""
+    def on_event(db_name, status, message):
+        # Called on scheduler threads; never touch widgets from here
+        root.ui_dispatcher.post(("backup", db_name), update_status_bar, root, message)
 
-    threading.Thread(target=daily_backup, daemon=True).start()
+    root.backup_scheduler = BackupScheduler(db_names, schedules, on_event=on_event)
+    root.backup_scheduler.start()
+    return root.backup_scheduler
 
 
 def on_double_click(event, tree, conn, user):
     rowid = tree.identify_row(event.y)
     column = tree.identify_column(event.x)
-    if rowid and column:
-        row_values = tree.item(rowid)['values']
-        column_index = int(column[1:]) - 1
-        current_value = row_values[column_index]
+    model = tree.master.master.model
+    if rowid and column and model.df is not None:
+        column_name = model.columns[int(column[1:]) - 1]
+        if model.is_from_database and column_name == rowid_alias(conn.cursor(), "daily_data"):
+            # It is the row's identity (an alias of rowid); saves address rows by it
+            update_status_bar(tree.master.master.master.master, f"{column_name} cannot be edited")
+            return
+        current_value = model.value(item_label(tree, rowid), column_name)
+        if pd.isna(current_value):
+            current_value = ''
         entry_popup(event.widget, current_value, rowid, column, tree, conn, user)
 
 def entry_popup(tree, value, rowid, column, treeview, conn, user):
@@ -120,79 +492,420 @@ def entry_popup(tree, value, rowid, column, treeview, conn, user):
 
 def on_return(event, entry, rowid, column, treeview, top, conn, user):
     new_value = entry.get()
-    old_value = treeview.item(rowid)['values'][int(column[1:]) - 1]
-    if new_value != old_value:
-        action = f"Updated row {rowid} column {column} from '{old_value}' to '{new_value}'"
+    model = treeview.master.master.model
+    label = item_label(treeview, rowid)
+    column_name = model.columns[int(column[1:]) - 1]
+    old_value = model.value(label, column_name)
+    # The model stores the edit typed and marks the row dirty; the view is redrawn from it
+    if model.set_value(label, column_name, new_value):
+        action = f"Updated row {label} column {column} from '{old_value}' to '{new_value}'"
         #log_action(user[0], action, conn)
         log_action(user[0], user[1], action, conn)  # Pass user[1] (username) here
-
-    treeview.set(rowid, column=column, value=new_value)
+        grid = getattr(treeview, 'virtual_grid', None)
+        if grid is not None:
+            grid.render()
+        else:
+            treeview.item(rowid, values=view_rows(model.df.loc[[label]])[0])
+        add_summary(treeview, model.df)
     entry.destroy()
     top.destroy()
     update_status_bar(treeview.master.master.master.master, "Data modified")
 
-def backup_data_handler(root, conn, user):
-    try:
+def backup_data_handler(root, tab, conn, user):
+    def work(job):
         print("Starting backup...")
-        backup_data(conn)
-        update_status_bar(root, "Data backed up successfully!")
+        worker_conn = init_db(tab.db_name)
+        job.on_cancel(worker_conn.interrupt)
+        try:
+            return backup_data(worker_conn)
+        finally:
+            worker_conn.close()
+
+    def done(result):
+        snapshot_id, kind, rows_written = result
+        update_status_bar(root, f"Data backed up successfully! (snapshot {snapshot_id}, {kind}, {rows_written} rows)")
         #print(f"Logging action for user: {user[0]}")
         print(f"Logging action for user: {user[1]}")
         log_action(user[0], user[1],"Saved to Backup", conn)
         #print("Action logged successfully.")
 
-    except Exception as e:
+    def failed(e):
         print(f"Error during backup: {e}")
         messagebox.showerror("Error", str(e))
         log_action(user[0], user[1],f"Failed to Save Backup: {str(e)}", conn)
 
+    root.jobs.submit("Save to Backup", work, tab=tab, tab_name=tab.db_name, on_done=done, on_error=failed)
 
 
-def import_data_handler(root, conn):
+
+def import_data_handler(root, tab, conn):
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls")])
     if file_path:
-        df = pd.read_excel(file_path)
         date_time = simpledialog.askstring("Input", "Enter date and time (YYYY-MM-DD HH:MM:SS):")
-        try:
-            insert_backup_data(conn, df, date_time)
-            update_status_bar(root, "Data imported successfully!")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+
+        def work(job):
+            worker_conn = init_db(tab.db_name)
+            try:
+                # Stream the workbook straight into backup_data instead of loading it whole.
+                # job.report raises JobCancelled on cancel, which rolls the import back.
+                return insert_backup_batches(
+                    worker_conn, iter_excel_batches(file_path), date_time, tuned_pragmas=True,
+                    progress=lambda count, rate: job.report(count, message=f"rows ({rate:,.0f} rows/s)"))
+            finally:
+                worker_conn.close()
+
+        def done(result):
+            rows, rate = result
+            update_status_bar(root, f"Data imported successfully! ({rows} rows, {rate:,.0f} rows/s)")
+
+        root.jobs.submit("Import Data", work, tab=tab, tab_name=tab.db_name, on_done=done)
 
 def execute_sql_query(conn):
     top = Toplevel()
     top.title("Execute SQL Query")
+    root = top.nametowidget(".")
+    db_name = database_name(conn)
 
     query_label = ttk.Label(top, text="SQL Query:")
     query_label.pack(pady=5)
     query_entry = ttk.Entry(top, width=100)
     query_entry.pack(pady=5)
 
-    def execute():
-        query = query_entry.get()
-        result_df = execute_query(conn, query)
-        result_window = Toplevel(top)
-        result_window.title("Query Result")
+    timeout_frame = ttk.Frame(top)
+    timeout_frame.pack(pady=5)
+    ttk.Label(timeout_frame, text="Timeout (s, 0 = none):").pack(side="left")
+    timeout_box = ttk.Spinbox(timeout_frame, from_=0, to=3600, width=6)
+    timeout_box.set(f"{QUERY_TIMEOUT:g}")
+    timeout_box.pack(side="left", padx=5)
+    status = ttk.Label(top, text="")
+    status.pack(pady=5)
+    running = []
+
+    def finished():
+        running.clear()
+        execute_button.config(state="normal")
+        profile_button.config(state="normal")
+        cancel_button.config(state="disabled")
 
-        tree = ttk.Treeview(result_window)
-        tree.pack(fill='both', expand=True)
-        tree["columns"] = list(result_df.columns)
-        tree["show"] = "headings"
+    def execute(profile=False):
+        try:
+            timeout = float(timeout_box.get())
+        except ValueError:
+            messagebox.showerror("Error", "The timeout must be a number of seconds.", parent=top)
+            return
+        # Statements run on a connection of their own, so the tab's connection is never
+        # blocked and the statement can be interrupted from here
+        result = QueryResult(query_entry.get(), timeout=timeout or None)
+
+        def work(job):
+            job.on_cancel(result.cancel)
+            conn = acquire_read_connection(db_name)
+            release = lambda conn: release_read_connection(db_name, conn)
+            if profile:
+                # Always really runs the statement, never answered from the cache
+                return result.profile(conn, release=release)
+            # Repeats of a statement are answered from query_cache until a table it reads changes
+            result.execute(conn, release=release, cache_key=query_cache_key(db_name, result.query, conn=conn))
+            return result.fetch_page()
+
+        def done(value):
+            finished()
+            status.config(text=result.describe())
+            if profile:
+                show_query_profile(top, result, *value)
+            else:
+                show_query_result(top, db_name, result, value)
+
+        def failed(e):
+            finished()
+            status.config(text=str(e))
+            if not isinstance(e, QueryCancelled):
+                messagebox.showerror("Error", str(e), parent=top)
+
+        def cancelled():
+            # Cancelled from the jobs panel or on quit, possibly before the job even started
+            result.cancel()
+            if top.winfo_exists():
+                finished()
+                status.config(text="Query cancelled")
 
-        for col in tree["columns"]:
-            tree.heading(col, text=col)
+        if root.jobs.submit("Profile SQL Query" if profile else "SQL Query", work, tab_name=db_name,
+                            on_done=done, on_error=failed, on_cancel=cancelled):
+            running.append(result)
+            execute_button.config(state="disabled")
+            profile_button.config(state="disabled")
+            cancel_button.config(state="normal")
 
-        for row in result_df.to_numpy():
-            tree.insert("", "end", values=row)
+    def cancel():
+        for result in running:
+            result.cancel()
 
-    execute_button = ttk.Button(top, text="Execute", command=execute)
-    execute_button.pack(pady=5)
+    button_frame = ttk.Frame(top)
+    button_frame.pack(pady=5)
+    execute_button = ttk.Button(button_frame, text="Execute", command=execute)
+    execute_button.pack(side="left", padx=5)
+    profile_button = ttk.Button(button_frame, text="Profile", command=lambda: execute(profile=True))
+    profile_button.pack(side="left", padx=5)
+    cancel_button = ttk.Button(button_frame, text="Cancel", command=cancel, state="disabled")
+    cancel_button.pack(side="left", padx=5)
 
-def download_backup(conn):
+def show_query_profile(parent, result, plan, warnings):
+    """Show the query plan, timings and full-scan warnings collected by QueryResult.profile."""
+    profile_window = Toplevel(parent)
+    profile_window.title("Query Profile")
+    text = tk.Text(profile_window, wrap="word", width=100, height=25)
+    text.pack(fill="both", expand=True)
+    text.tag_configure("warning", foreground="red")
+    per_row = f" ({result.vm_steps / result.rows_fetched:,.0f} per row returned)" if result.rows_fetched else ""
+    text.insert("end", f"Wall time: {result.elapsed:.3f} s\n"
+                       f"Rows returned: {result.rows_fetched}\n"
+                       f"VM steps: ~{result.vm_steps:,} (counted every {PROFILE_STEPS}){per_row}\n\n")
+    for warning in warnings:
+        text.insert("end", f"Warning: {warning}\n", "warning")
+    text.insert("end", f"\nQuery plan:\n{format_query_plan(plan)}\n")
+    text.config(state="disabled")
+
+def show_query_result(parent, db_name, result, rows):
+    """
+    Show a QueryResult page by page: the first page right away, the next one
+    whenever the view is scrolled close to the end of what has been fetched.
+    Pages are fetched by background jobs, which the window's Cancel interrupts.
+    """
+    root = parent.nametowidget(".")
+    result_window = Toplevel(parent)
+    result_window.title("Query Result")
+
+    status = ttk.Label(result_window, anchor="w")
+    status.pack(side="bottom", fill="x")
+    tree_frame = ttk.Frame(result_window)
+    tree_frame.pack(fill='both', expand=True)
+    tree = ttk.Treeview(tree_frame)
+    scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+    scrollbar.pack(side="right", fill="y")
+    tree.pack(fill='both', expand=True)
+    tree["columns"] = result.columns
+    tree["show"] = "headings"
+    for col in tree["columns"]:
+        tree.heading(col, text=col)
+    fetching = []
+
+    def show_rows(rows):
+        fetching.clear()
+        if not result_window.winfo_exists():
+            return
+        for row in rows:
+            tree.insert("", "end", values=["" if value is None else value for value in row])
+        status.config(text=result.describe())
+
+    def fetch_failed(e):
+        fetching.clear()
+        if result_window.winfo_exists():
+            status.config(text=result.describe() if isinstance(e, QueryCancelled) else str(e))
+
+    def fetch_job(job):
+        job.on_cancel(result.cancel)
+        return result.fetch_page()
+
+    def fetch_page():
+        if fetching or result.exhausted:
+            return
+        if root.jobs.submit("Fetch Query Rows", fetch_job, tab_name=db_name,
+                            on_done=show_rows, on_error=fetch_failed,
+                            on_cancel=lambda: fetch_failed(QueryCancelled("Query cancelled"))):
+            fetching.append(True)
+
+    def on_scroll(first, last):
+        scrollbar.set(first, last)
+        if float(last) > QUERY_PREFETCH_AT and not result.exhausted:
+            result_window.after_idle(fetch_page)
+
+    def export():
+        # The only path that reads the whole result, and it streams it to disk
+        fmt = "csv"
+        file_path = filedialog.asksaveasfilename(parent=result_window, defaultextension=".csv",
+                                                 filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx")])
+        if not file_path:
+            return
+        if file_path.lower().endswith(".xlsx"):
+            fmt = "xlsx"
+
+        def work(job):
+            with read_connection(db_name) as worker_conn:
+                job.on_cancel(worker_conn.interrupt)
+                try:
+                    return export_batches(file_path, fmt, iter_query_batches(worker_conn, result.query),
+                                          progress=lambda count, total: job.report(count, total, "rows written"))
+                finally:
+                    job.remove_cancel_hook(worker_conn.interrupt)
+
+        root.jobs.submit("Export Query Result", work, tab_name=db_name,
+                         on_done=lambda rows: update_status_bar(root, f"Exported {rows} query rows to {file_path}"))
+
+    tree.configure(yscrollcommand=on_scroll)
+    button_frame = ttk.Frame(result_window)
+    button_frame.pack(side="bottom", pady=5)
+    if result.returns_rows:
+        ttk.Button(button_frame, text="Export...", command=export).pack(side="left", padx=5)
+    ttk.Button(button_frame, text="Cancel", command=result.cancel).pack(side="left", padx=5)
+    # Closing the window stops any fetch in flight and releases the cursor and its connection
+    result_window.bind("<Destroy>", lambda event: result.cancel() if event.widget is result_window else None)
+    show_rows(rows)
+
+def download_backup(tab):
+    root = tab.master.master
     file_path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("SQLite files", "*.db")])
-    if file_path:
-        conn.backup(sqlite3.connect(file_path))
-        update_status_bar(root, "Database backup downloaded successfully!")
+    if not file_path:
+        return
+
+    def work(job):
+        source = init_db(tab.db_name)
+        try:
+            online_backup(source, file_path,
+                          progress=lambda status, remaining, total: job.report(total - remaining, total, "pages copied"))
+        except JobCancelled:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        finally:
+            source.close()
+
+    root.jobs.submit("Download Backup", work, tab=tab, tab_name=tab.db_name,
+                     on_done=lambda _: update_status_bar(root, "Database backup downloaded successfully!"))
+
+def archive_handler(root, tab, conn, user):
+    """
+    Write a compressed archive of the tab's database, apply the retention policy, then
+    move backup_data days older than BACKUP_ARCHIVE_AGE_DAYS out to Parquet.
+    """
+    def work(job):
+        interruptible = lambda worker_conn: job.on_cancel(worker_conn.interrupt)
+        entry = create_archive(tab.db_name, progress=lambda done, total: job.report(done, total, "bytes compressed"),
+                               on_connect=interruptible)
+        removed = prune_archives(tab.db_name)
+        days = archive_backup_partitions(tab.db_name,
+                                         progress=lambda done, total: job.report(done, total, "backup days archived"),
+                                         on_connect=interruptible)
+        return entry, removed, days
+
+    def done(result):
+        entry, removed, days = result
+        log_action(user[0], user[1], "Archived Database", conn)
+        update_status_bar(root, f"Archived {tab.db_name} to {entry['file']} ({entry['size']} of {entry['raw_size']} "
+                                f"bytes), pruned {len(removed)} old archives, moved {len(days)} backup days to Parquet")
+
+    root.jobs.submit("Archive Database", work, tab=tab, tab_name=tab.db_name, on_done=done)
+
+def open_restore_window(tab, conn, user):
+    root = tab.master.master
+    top = Toplevel(root)
+    top.title(f"Restore {tab.db_name}")
+
+    snapshots = ttk.Treeview(top, height=8)
+    snapshots.pack(fill='x', padx=10, pady=5)
+    snapshots["columns"] = ("ID", "Taken", "Kind", "Rows Written")
+    snapshots["show"] = "headings"
+    for col in snapshots["columns"]:
+        snapshots.heading(col, text=col)
+    try:
+        for row in list_snapshots(conn).itertuples(index=False):
+            if not row.archived:
+                snapshots.insert("", "end", iid=str(row.id), values=(row.id, row.created_at, row.kind, row.row_count))
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        pass  # No backups taken yet
+
+    summary = ttk.Label(top, text="Select a snapshot and preview it.")
+    summary.pack(pady=5)
+    preview = ttk.Treeview(top)
+    preview.pack(fill='both', expand=True, padx=10)
+    button_frame = ttk.Frame(top)
+    button_frame.pack(pady=10)
+
+    def selected_snapshot():
+        selection = snapshots.selection()
+        if not selection:
+            messagebox.showinfo("Restore", "Select a snapshot first.", parent=top)
+            return None
+        return int(selection[0])
+
+    def show_diff(diff):
+        counts = diff["Change"].value_counts()
+        summary.config(text=f"{counts.get('add', 0)} rows come back, {counts.get('change', 0)} change, "
+                            f"{counts.get('remove', 0)} are removed")
+        shown = diff.head(RESTORE_PREVIEW_ROWS)
+        preview.delete(*preview.get_children())
+        preview["columns"] = list(shown.columns)
+        preview["show"] = "headings"
+        for col in shown.columns:
+            preview.heading(col, text=col)
+        for row in view_rows(shown):
+            preview.insert("", "end", values=row)
+
+    def preview_snapshot():
+        snapshot_id = selected_snapshot()
+        if snapshot_id is None:
+            return
+
+        def work(job):
+            with read_connection(tab.db_name) as worker_conn:
+                job.on_cancel(worker_conn.interrupt)
+                try:
+                    return diff_snapshot(worker_conn, snapshot_id)
+                finally:
+                    job.remove_cancel_hook(worker_conn.interrupt)
+
+        root.jobs.submit("Preview Restore", work, tab=tab, tab_name=tab.db_name,
+                         on_done=lambda diff: show_diff(diff) if top.winfo_exists() else None)
+
+    def restore():
+        snapshot_id = selected_snapshot()
+        if snapshot_id is None:
+            return
+        if has_unsaved_edits(tab):
+            messagebox.showwarning("Restore", "Save or discard the edits on this tab before restoring.", parent=top)
+            return
+        if not messagebox.askyesno("Restore", f"Replace daily_data of {tab.db_name} with snapshot {snapshot_id}?",
+                                   parent=top):
+            return
+
+        def work(job):
+            worker_conn = init_db(tab.db_name)
+            job.on_cancel(worker_conn.interrupt)
+            try:
+                return restore_snapshot(worker_conn, snapshot_id)
+            finally:
+                worker_conn.close()
+
+        def done(rows):
+            tab.reload_requested = True
+            log_action(user[0], user[1], f"Restored snapshot {snapshot_id}", conn)
+            update_status_bar(root, f"Restored {rows} rows of {tab.db_name} from snapshot {snapshot_id}")
+            if top.winfo_exists():
+                top.destroy()
+
+        root.jobs.submit("Restore Snapshot", work, tab=tab, tab_name=tab.db_name, on_done=done)
+
+    ttk.Button(button_frame, text="Preview", command=preview_snapshot).pack(side="left", padx=5)
+    ttk.Button(button_frame, text="Restore", command=restore).pack(side="left", padx=5)
+
+def verify_archives_handler(root):
+    db_names = [tab.db_name for tab in root.tabs]
+
+    def work(job):
+        results = []
+        for index, db_name in enumerate(db_names):
+            job.report(index, len(db_names), f"verifying {db_name}")
+            results += [(db_name, file_name, ok, reason) for file_name, ok, reason in verify_archives(db_name)]
+        return results
+
+    def done(results):
+        failed = [f"{db_name}/{file_name}: {reason}" for db_name, file_name, ok, reason in results if not ok]
+        if failed:
+            messagebox.showerror("Archive Verification", "\n".join(failed))
+        else:
+            messagebox.showinfo("Archive Verification", f"All {len(results)} archives match their checksums.")
+
+    root.jobs.submit("Verify Archives", work, on_done=done)
+
 def display_log(root, conn, last_timestamp):
     cursor = conn.cursor()
     cursor.execute(
@@ -222,29 +935,115 @@ def start_log_polling(root, conn, last_timestamp_var):
     root.after(1000, start_log_polling, root, conn, last_timestamp_var)
 
 
+def can_apply_delta(tab, previous_version, current_version):
+    """A row delta is only safe while the schema is unchanged and the tab holds rowid-keyed data."""
+    if previous_version is None or previous_version[0] != current_version[0]:
+        return False
+    if previous_version[1] is None or current_version[1] is None:
+        return False
+    return hasattr(tab, 'model') and tab.model.is_from_database
+
+def refresh_tab_full(root, tab, df, version):
+    """Tk-thread half of a full refresh: redraw the tab from a freshly read DataFrame in chunks."""
+    if has_unsaved_edits(tab):
+        return  # Keep the user's edits; the save itself moves the version and triggers a refresh
+    # Until the last chunk lands the tab matches no database version; if this load
+    # is cancelled the worker sees applied_version None and sends a full reload again.
+    old_df = tab.model.df
+    tab.applied_version = None
+    tab.model.load(df)
+    try:
+        if can_reconcile(tab.tree, old_df, df):
+            yield from reconcile_treeview(tab.tree, old_df, df)
+        else:
+            yield from render_df_in_treeview(tab.tree, df)
+    except GeneratorExit:
+        tab.tree.view_stale = True  # The tree is half-updated, so the next refresh must not diff against it
+        raise
+    tab.applied_version = version
+    update_status_bar(root, f"Data refreshed at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+def refresh_tab_delta(root, tab, changed_df, deleted_ids, version):
+    """Tk-thread half of a delta refresh: patch only the rows that changed, in chunks."""
+    if has_unsaved_edits(tab):
+        return
+    if tab.applied_version is None or list(changed_df.columns) != tab.model.columns:
+        tab.reload_requested = True  # The delta no longer fits what is shown; ask for a full reload
+        return
+    # As in refresh_tab_full, a delta cut short leaves the tab at no version, so the worker reloads it
+    tab.applied_version = None
+    try:
+        yield from apply_row_changes(tab.tree, tab.model, changed_df, deleted_ids)
+    except GeneratorExit:
+        tab.tree.view_stale = True
+        raise
+    tab.applied_version = version
+    update_status_bar(root, f"Data refreshed at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
 def start_data_refresh(root, db_names):
+    """
+    Poll every database for changes on a worker thread.
+
+    The worker only reads from SQLite; all widget updates are posted to
+    root.ui_dispatcher keyed by tab, so a slow UI coalesces several pending
+    refreshes of one tab into the newest. Deltas are computed against the version
+    the Tk thread last applied (tab.applied_version), which keeps every post a
+    self-contained superset of the ones it replaces.
+    """
     def refresh_data():
-        last_hashes = [None] * len(db_names)
+        # Read-only connections stay open for the life of the thread so PRAGMA data_version
+        # can tell us cheaply whether anyone else has committed since the last tick.
+        conns = [open_read_only(db_name) for db_name in db_names]
+        last_data_versions = [None] * len(db_names)
+        last_posted_versions = [None] * len(db_names)
         while True:
-            for i, (db_name, tab) in enumerate(zip(db_names, root.tabs)):
-                conn = init_db(db_name)  # Open a new connection in this thread
+            for i, tab in enumerate(list(root.tabs)):
+                conn = conns[i]
                 try:
-                    current_hash = get_table_hash(conn, "daily_data")
-
-                    if last_hashes[i] is None or current_hash != last_hashes[i]:
-                        last_hashes[i] = current_hash
-                        full_data_df = get_dataframe(conn, "daily_data")
-
-                        # Ensure tree exists and refresh the data
-                        if hasattr(tab, 'tree'):
-                            display_df_in_treeview(tab.tree, full_data_df)
-                            tab.treeview_df = full_data_df
-                            update_status_bar(root,
-                                              f"Data refreshed at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                    reload_requested = getattr(tab, 'reload_requested', False)
+                    data_version = get_data_version(conn)
+                    if data_version == last_data_versions[i] and not reload_requested:
+                        continue
+                    last_data_versions[i] = data_version
+
+                    current_version = get_table_version(conn, "daily_data")
+                    if current_version is not None and not tracking_installed(conn, "daily_data"):
+                        # Table was (re)created without triggers, e.g. by to_sql(if_exists='replace'),
+                        # which leaves its table_versions row behind
+                        write_conn = init_db(db_names[i])
+                        try:
+                            install_change_tracking(write_conn, "daily_data")
+                        finally:
+                            write_conn.close()
+                        current_version = get_table_version(conn, "daily_data")
+
+                    if current_version is None or not hasattr(tab, 'tree'):
+                        continue
+                    applied_version = getattr(tab, 'applied_version', None)
+                    if reload_requested:
+                        tab.reload_requested = False
+                        applied_version = None
+                    elif current_version in (applied_version, last_posted_versions[i]):
+                        continue
+                    last_posted_versions[i] = current_version
+
+                    if can_apply_delta(tab, applied_version, current_version):
+                        changed_df, deleted_ids = get_row_changes(conn, "daily_data", applied_version[1])
+                        root.ui_dispatcher.post(("refresh", tab), refresh_tab_delta, root, tab,
+                                                changed_df, deleted_ids, current_version)
+                    else:
+                        full_data_df = get_dataframe(conn, "daily_data", with_rowid=True)
+                        if full_data_df is None:
+                            if conn.execute("SELECT EXISTS (SELECT 1 FROM daily_data)").fetchone()[0]:
+                                tab.reload_requested = True  # The read failed; try again next tick
+                                continue
+                            # The table is empty now (e.g. restored from an empty snapshot); clear the tab
+                            columns = [info[1] for info in conn.execute('PRAGMA table_info("daily_data")')]
+                            full_data_df = pd.DataFrame(columns=columns, index=pd.Index([], name=ROWID_COLUMN))
+                        root.ui_dispatcher.post(("refresh", tab), refresh_tab_full, root, tab,
+                                                full_data_df, current_version)
                 except Exception as e:
                     print(f"Error refreshing data: {e}")
-                finally:
-                    conn.close()  # Ensure the connection is closed
             time.sleep(2)  # Poll every 2 seconds
 
-    threading.Thread(target=refresh_data, daemon=True).start()
\ No newline at end of file
+    threading.Thread(target=refresh_data, daemon=True).start()
@@ -1,12 +1,16 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from design import setup_ui, setup_login_screen
-from logic import update_status_bar, schedule_daily_backup, start_data_refresh
+from logic import update_status_bar, start_backup_scheduler, start_data_refresh
 from database import init_db, create_logs_table
 from auth import login, log_action
 
 def on_closing():
     if messagebox.askokcancel("Quit", "Do you want to quit?"):
+        if hasattr(root, "jobs"):
+            root.jobs.shutdown()
+        if hasattr(root, "backup_scheduler"):
+            root.backup_scheduler.stop()
         root.destroy()
 
 if __name__ == "__main__":
@@ -23,6 +27,7 @@ if __name__ == "__main__":
             login_window.destroy()
             setup_ui(root, ["test1", "test2", "test3", "test4"], user)  # Pass user to setup_ui
             start_data_refresh(root, ["test1", "test2", "test3", "test4"])  # Start the data refresh process
+            start_backup_scheduler(root, ["test1", "test2", "test3", "test4"])
 
             log_action(user[0], username, "Logged in", user_conn)  # Pass username here
         else:
@@ -0,0 +1,107 @@
+import re
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+QUERY_CACHE_BUDGET = 64 * 1024 * 1024  # bytes of cached results kept across all databases
+QUERY_CACHE_MAX_ENTRY = QUERY_CACHE_BUDGET // 4  # larger results are never cached
+
+# Statements whose result can change without the data changing
+VOLATILE_SQL = re.compile(r"\b(random|randomblob|changes|total_changes|last_insert_rowid)\s*\("
+                          r"|\b(date|time|datetime|julianday|unixepoch)\s*\(\s*\)"
+                          r"|\bcurrent_(date|time|timestamp)\b|'now'",
+                          re.IGNORECASE)
+SQL_LITERAL = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])""")
+
+
+def normalize_sql(query):
+    """
+    Collapse whitespace and case outside literals and quoted names, and drop a trailing ';'.
+    Keywords and unquoted names are case-insensitive in SQLite, so this keeps the meaning.
+    """
+    parts = SQL_LITERAL.split(query)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i]).lower()
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def statement_tables(conn, query, params=()):
+    """
+    Names of the tables query reads, as SQLite's authorizer reports them while compiling it,
+    or None if that cannot be told (the statement does not compile, or runs a PRAGMA).
+    """
+    tables = set()
+    opaque = []
+
+    def authorize(action, arg1, arg2, db_name, trigger):
+        if action == sqlite3.SQLITE_READ and arg1:
+            tables.add(arg1)
+        elif action == sqlite3.SQLITE_PRAGMA:
+            opaque.append(arg1)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorize)
+    try:
+        # EXPLAIN compiles the statement without running it
+        conn.execute(f"EXPLAIN {query}", params).fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.set_authorizer(None)
+    return None if opaque else tables
+
+
+def rows_size(rows):
+    """Rough in-memory size of a list of row tuples."""
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+                                     for row in rows)
+
+
+class QueryCache:
+    """
+    LRU cache of query results under a memory budget, safe to share between threads.
+
+    Keys come from database.query_cache_key and include the change versions of the
+    tables a result was read from, so an entry is never served once one of them has
+    changed; stale entries are simply never asked for again and age out of the LRU order.
+    """
+
+    def __init__(self, budget=QUERY_CACHE_BUDGET, max_entry=QUERY_CACHE_MAX_ENTRY):
+        self.budget = budget
+        self.max_entry = max_entry
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if key is None or size > self.max_entry:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.budget:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+query_cache = QueryCache()
@@ -0,0 +1,232 @@
+import re
+import sqlite3
+import threading
+import time
+from query_cache import query_cache, rows_size
+
+QUERY_PAGE_SIZE = 500
+QUERY_TIMEOUT = 30.0  # seconds SQLite may spend on one execute or page fetch; None disables it
+PROGRESS_STEPS = 1000  # VM instructions between cancellation/deadline checks
+PROFILE_STEPS = 100  # finer step count while profiling, so vm_steps is closer to the truth
+SCAN_WARN_TABLES = ("daily_data", "backup_data", "logs")  # large tables that should not be scanned
+
+# 'SCAN daily_data' or 'SCAN d' (an alias); older SQLite says 'SCAN TABLE daily_data'.
+# 'SCAN x USING ... INDEX' walks an index instead of the table, so it is not matched.
+PLAN_TABLE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+TABLE_ALIAS = re.compile(r"""\b(?:from|join)\s+["`\[]?(\w+)["`\]]?\s+(?:as\s+)?(\w+)""", re.IGNORECASE)
+SQL_KEYWORDS = {"where", "join", "inner", "left", "right", "full", "cross", "natural", "on", "using", "group",
+                "order", "limit", "union", "except", "intersect", "having", "window", "as", "indexed", "not"}
+
+
+class QueryCancelled(sqlite3.OperationalError):
+    pass
+
+
+class QueryTimeout(sqlite3.OperationalError):
+    pass
+
+
+class QueryResult:
+    """
+    Open cursor over an ad-hoc statement, read a page at a time with fetchmany.
+
+    Only the pages the caller asks for are ever fetched, so a careless
+    SELECT * over a large table costs one page until the user scrolls further.
+    Statements that return no rows (e.g. UPDATE) report rowcount instead.
+    Given a cache_key, a result read to the end is stored in query_cache, and a
+    later execute with the same key pages through the stored rows instead.
+
+    execute() and fetch_page() are meant for a worker thread. Each call may spend
+    at most `timeout` seconds inside SQLite, enforced by a progress handler, and
+    cancel() may be called from any thread: it interrupts a running call, or closes
+    an idle cursor straight away so its read lock is released.
+    """
+
+    def __init__(self, query, params=(), page_size=QUERY_PAGE_SIZE, timeout=QUERY_TIMEOUT):
+        self.query = query
+        self.params = params
+        self.page_size = page_size
+        self.timeout = timeout
+        self.columns = []
+        self.returns_rows = False
+        self.rowcount = -1
+        self.rows_fetched = 0
+        self.elapsed = 0.0
+        self.vm_steps = 0
+        self.progress_steps = PROGRESS_STEPS
+        self.exhausted = False
+        self.cancelled = False
+        self.conn = None
+        self.cursor = None
+        self.from_cache = False
+        self._release = None
+        self._cache_key = None
+        self._cached_rows = None  # rows served from, or being collected for, the cache
+        self._deadline = None
+        self._lock = threading.Lock()
+
+    def execute(self, conn, release=None, cache_key=None):
+        """Run the statement on conn; release(conn), if given, is called once the result is closed."""
+        self.conn = conn
+        self._release = release
+        self._cache_key = cache_key
+        cached = query_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            # Nothing to read, so the connection goes straight back
+            self.conn = None
+            if release:
+                release(conn)
+            if self.cancelled:
+                raise QueryCancelled("Query cancelled")
+            self.columns, self._cached_rows = cached
+            self.returns_rows = True
+            self.from_cache = True
+            self.exhausted = False
+            return self
+        self._cached_rows = [] if cache_key else None
+        conn.set_progress_handler(self._should_abort, self.progress_steps)
+        self.cursor = conn.cursor()
+        self._call(self.cursor.execute, self.query, self.params)
+        self.columns = [desc[0] for desc in self.cursor.description] if self.cursor.description else []
+        self.returns_rows = self.cursor.description is not None
+        self.rowcount = self.cursor.rowcount
+        if not self.returns_rows:
+            conn.commit()
+            self.close()
+        return self
+
+    def fetch_page(self):
+        """Return the next page of rows (an empty list once the result is exhausted)."""
+        if self.exhausted:
+            return []
+        if self.from_cache:
+            rows = self._cached_rows[self.rows_fetched:self.rows_fetched + self.page_size]
+            self.rows_fetched += len(rows)
+            self.exhausted = self.rows_fetched >= len(self._cached_rows)
+            return rows
+        rows = self._call(self.cursor.fetchmany, self.page_size)
+        self.rows_fetched += len(rows)
+        if self._cached_rows is not None:
+            self._cached_rows.extend(rows)
+            if len(self._cached_rows) * len(self.columns) > query_cache.max_entry // 16:
+                # Every value costs well over 16 bytes, so this is past max_entry; stop collecting
+                self._cached_rows = None
+        if len(rows) < self.page_size:
+            if self._cached_rows is not None and not self.cancelled:
+                query_cache.put(self._cache_key, (self.columns, self._cached_rows), rows_size(self._cached_rows))
+            self.close()
+        return rows
+
+    def profile(self, conn, release=None):
+        """
+        Run the statement to the end without keeping its rows and return its query plan.
+
+        Afterwards elapsed holds the wall time, rows_fetched the rows returned and
+        vm_steps the VM instructions executed (to within PROFILE_STEPS). Returns
+        (plan, warnings): the EXPLAIN QUERY PLAN rows and the full-scan warnings.
+        """
+        try:
+            plan = explain_query_plan(conn, self.query, self.params)
+        except BaseException:
+            if release:
+                release(conn)
+            raise
+        self.progress_steps = PROFILE_STEPS
+        self.execute(conn, release=release)
+        while not self.exhausted:
+            self.fetch_page()
+        return plan, full_scan_warnings(plan, self.query)
+
+    def cancel(self):
+        self.cancelled = True
+        if self._lock.acquire(blocking=False):
+            try:
+                self.close()  # Idle between pages: just let go of the cursor
+            finally:
+                self._lock.release()
+        elif self.conn is not None:
+            self.conn.interrupt()
+
+    def close(self):
+        if self.exhausted and self.cursor is None:
+            return
+        self.exhausted = True
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+        if self.conn is not None:
+            # Resetting the statement above already ended its read transaction
+            self.conn.set_progress_handler(None, 0)
+            if self._release:
+                self._release(self.conn)
+            self.conn = None
+
+    def describe(self):
+        if self.cancelled:
+            return f"Cancelled after {self.rows_fetched} rows, {self.elapsed:.3f} s"
+        if not self.returns_rows:
+            return f"{self.rowcount} rows affected in {self.elapsed:.3f} s"
+        more = "" if self.exhausted else "+ (scroll for more)"
+        if self.from_cache:
+            return f"{self.rows_fetched}{more} rows from cache"
+        return f"{self.rows_fetched}{more} rows in {self.elapsed:.3f} s"
+
+    def _call(self, func, *args):
+        with self._lock:
+            if self.cancelled:
+                self.close()
+                raise QueryCancelled("Query cancelled")
+            started = time.perf_counter()
+            self._deadline = started + self.timeout if self.timeout else None
+            try:
+                return func(*args)
+            except sqlite3.OperationalError as e:
+                timed_out = self._deadline is not None and time.perf_counter() > self._deadline
+                self.close()
+                if self.cancelled:
+                    raise QueryCancelled("Query cancelled") from e
+                if timed_out:
+                    raise QueryTimeout(f"Query stopped after the {self.timeout:g} s timeout") from e
+                raise
+            except Exception:
+                self.close()
+                raise
+            finally:
+                self._deadline = None
+                self.elapsed += time.perf_counter() - started
+
+    def _should_abort(self):
+        self.vm_steps += self.progress_steps
+        return self.cancelled or (self._deadline is not None and time.perf_counter() > self._deadline)
+
+
+def explain_query_plan(conn, query, params=()):
+    """EXPLAIN QUERY PLAN of query as (id, parent, detail) rows."""
+    return [(row[0], row[1], row[3]) for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+def format_query_plan(plan):
+    """Indent each plan step under its parent, like the sqlite3 shell's .eqp output."""
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, detail in plan:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[node_id] + detail)
+    return "\n".join(lines)
+
+
+def full_scan_warnings(plan, query, tables=SCAN_WARN_TABLES):
+    """A warning for each step of plan that scans a whole table from tables, aliases resolved through query."""
+    aliases = {alias.lower(): table.lower() for table, alias in TABLE_ALIAS.findall(query)
+               if alias.lower() not in SQL_KEYWORDS}
+    warnings = []
+    for _, _, detail in plan:
+        match = PLAN_TABLE_SCAN.match(detail)
+        if not match:
+            continue
+        name = match.group(1).lower()
+        table = aliases.get(name, name)
+        if table in tables:
+            warnings.append(f"Full table scan of {table} ({detail}); "
+                            f"an index on the filtered or joined columns would avoid it")
+    return warnings
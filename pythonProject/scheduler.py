@@ -0,0 +1,235 @@
+import datetime
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database import init_db, backup_data
+from change_tracking import table_exists
+
+DEFAULT_BACKUP_SCHEDULE = "0 2 * * *"  # every day at 02:00
+MAX_BACKUP_JITTER = 300  # seconds added at random to each run, so databases do not start together
+MAX_CONCURRENT_BACKUPS = 2
+RETRY_DELAY = datetime.timedelta(minutes=15)
+MAX_WAIT = 60  # seconds; the loop re-reads the clock at least this often, so sleep/resume cannot cause drift
+
+CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+
+def parse_cron_field(field, low, high):
+    """Expand one cron field ('*', '5', '1-5', '*/15', '0-30/10', or a comma list of those) to a set."""
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(bound) for bound in part.split("-", 1))
+        else:
+            start = end = int(part)
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Invalid cron field '{field}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    A five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Day-of-week counts from 0 (or 7) for Sunday. As in cron, when both the day of
+    the month and the day of the week are restricted a day matching either fires.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Cron expression '{expression}' needs {len(CRON_FIELDS)} fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_cron_field(field, low, high) for field, (_, low, high) in zip(fields, CRON_FIELDS))
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def matches_day(self, day):
+        if day.month not in self.months:
+            return False
+        day_matches = day.day in self.days
+        weekday_matches = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def next_after(self, moment):
+        """The first time strictly after moment (to the minute) that the schedule fires."""
+        start = (moment + datetime.timedelta(minutes=1)).replace(second=0, microsecond=0)
+        day = start.date()
+        times = [datetime.time(hour, minute) for hour in sorted(self.hours) for minute in sorted(self.minutes)]
+        for _ in range(366 * 8):  # e.g. '0 0 29 2 *' can be eight years apart across a skipped leap year
+            if self.matches_day(day):
+                for time_of_day in times:
+                    candidate = datetime.datetime.combine(day, time_of_day)
+                    if candidate >= start:
+                        return candidate
+            day += datetime.timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+
+def ensure_schedule_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS backup_schedule (
+        name TEXT PRIMARY KEY,
+        schedule TEXT,
+        last_run TEXT,
+        last_status TEXT,
+        last_error TEXT
+    )
+    """)
+    conn.commit()
+
+
+def load_last_run(db_name, name="backup"):
+    conn = init_db(db_name)
+    try:
+        ensure_schedule_table(conn)
+        row = conn.execute("SELECT last_run FROM backup_schedule WHERE name=? AND last_status IN ('ok', 'skipped')",
+                           (name,)).fetchone()
+    finally:
+        conn.close()
+    return datetime.datetime.fromisoformat(row[0]) if row and row[0] else None
+
+
+def save_run_state(db_name, schedule, last_run, status, error=None, name="backup"):
+    conn = init_db(db_name)
+    try:
+        ensure_schedule_table(conn)
+        if status in ("ok", "skipped"):
+            conn.execute("""
+                INSERT INTO backup_schedule (name, schedule, last_run, last_status, last_error)
+                VALUES (?, ?, ?, ?, NULL)
+                ON CONFLICT (name) DO UPDATE SET schedule=excluded.schedule, last_run=excluded.last_run,
+                                                 last_status=excluded.last_status, last_error=NULL
+            """, (name, schedule, last_run.isoformat(sep=" ", timespec="seconds"), status))
+        else:
+            # Keep the last successful run so catch-up still knows what was missed
+            conn.execute("""
+                INSERT INTO backup_schedule (name, schedule, last_status, last_error) VALUES (?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET schedule=excluded.schedule, last_status=excluded.last_status,
+                                                 last_error=excluded.last_error
+            """, (name, schedule, status, error))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_backup(db_name):
+    """backup_data on a connection of its own; None if there is no daily_data to back up yet."""
+    conn = init_db(db_name)
+    try:
+        if not table_exists(conn, "daily_data"):
+            return None
+        return backup_data(conn)
+    finally:
+        conn.close()
+
+
+class BackupScheduler:
+    """
+    Runs backup_data for several databases on cron schedules.
+
+    The last successful run of each database is stored in its own backup_schedule
+    table. On start a database whose schedule fired since then (or that was never
+    backed up) is caught up straight away; otherwise it waits for its next slot.
+    Each run is delayed by a random jitter of up to `jitter` seconds and at most
+    `max_concurrent` backups run at once. Failed runs are retried after RETRY_DELAY;
+    a database with nothing to back up (run returns None) is skipped until its next slot.
+    on_event(db_name, status, message) is called from worker threads.
+    """
+
+    def __init__(self, db_names, schedules=None, jitter=MAX_BACKUP_JITTER, max_concurrent=MAX_CONCURRENT_BACKUPS,
+                 on_event=None, run=run_backup):
+        schedules = schedules or {}
+        self.schedules = {db_name: CronSchedule(schedules.get(db_name, DEFAULT_BACKUP_SCHEDULE))
+                          for db_name in db_names}
+        self.jitter = jitter
+        self.on_event = on_event
+        self.run = run
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="backup")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._slots = {}  # db_name -> the schedule time being served, recorded as last_run
+        self._due = {}  # db_name -> slot plus jitter
+        self._running = set()
+
+    def start(self):
+        now = datetime.datetime.now()
+        for db_name, schedule in self.schedules.items():
+            last_run = load_last_run(db_name)
+            if last_run is None or schedule.next_after(last_run) <= now:
+                self._plan(db_name, now)  # missed while the app was closed
+            else:
+                self._plan(db_name, schedule.next_after(now))
+        threading.Thread(target=self._loop, daemon=True, name="backup-scheduler").start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def next_runs(self):
+        with self._lock:
+            return dict(self._due)
+
+    def _plan(self, db_name, slot, delay=None):
+        with self._lock:
+            self._slots[db_name] = slot
+            self._due[db_name] = slot + (delay or datetime.timedelta(seconds=random.uniform(0, self.jitter)))
+
+    def _loop(self):
+        while not self._stopped:
+            now = datetime.datetime.now()
+            with self._lock:
+                due_now = [db_name for db_name, due in self._due.items()
+                           if due <= now and db_name not in self._running]
+                self._running.update(due_now)
+                upcoming = [due for db_name, due in self._due.items() if db_name not in self._running]
+            for db_name in due_now:
+                self._executor.submit(self._run, db_name)
+            wait = min([(due - now).total_seconds() for due in upcoming] + [MAX_WAIT])
+            self._wakeup.wait(max(wait, 0.5))
+            self._wakeup.clear()
+
+    def _run(self, db_name):
+        schedule = self.schedules[db_name]
+        slot = self._slots[db_name]
+        try:
+            if self.on_event:
+                self.on_event(db_name, "running", f"Scheduled backup of {db_name} started")
+            result = self.run(db_name)
+            save_run_state(db_name, schedule.expression, slot, "ok" if result else "skipped")
+            self._plan(db_name, schedule.next_after(max(slot, datetime.datetime.now())))
+            if result is None:
+                if self.on_event:
+                    self.on_event(db_name, "skipped", f"Scheduled backup of {db_name} skipped: no daily_data yet")
+                return
+            snapshot_id, kind, rows_written = result
+            if self.on_event:
+                self.on_event(db_name, "ok", f"Scheduled backup of {db_name} completed "
+                                             f"(snapshot {snapshot_id}, {kind}, {rows_written} rows)")
+        except Exception as e:
+            try:
+                save_run_state(db_name, schedule.expression, slot, "failed", str(e))
+            except Exception as state_error:
+                print(f"Could not record backup state for {db_name}: {state_error}")
+            # Retry the same slot later instead of waiting for the next day
+            self._plan(db_name, slot, delay=datetime.datetime.now() - slot + RETRY_DELAY)
+            if self.on_event:
+                self.on_event(db_name, "failed", f"Scheduled backup of {db_name} failed: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(db_name)
+            self._wakeup.set()
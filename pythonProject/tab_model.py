@@ -0,0 +1,121 @@
+import pandas as pd
+from change_tracking import ROWID_COLUMN
+
+
+def view_rows(df):
+    """Rows of df as lists ready for a Treeview, with missing values shown as ''."""
+    return df.astype(object).where(df.notna(), '').to_numpy().tolist()
+
+
+def _same_value(old, new):
+    if pd.isna(old) and pd.isna(new):
+        return True
+    return old == new
+
+
+class TabModel:
+    """
+    Typed, columnar data behind one notebook tab.
+
+    The DataFrame keeps the dtypes it was read with and the Treeview only renders
+    from it. Edits from on_return land here, coerced to the column's type where
+    possible, and are tracked by index label, so save, export and the summary read
+    the model instead of scraping values back out of the widget. Data read from
+    daily_data is indexed by rowid; a loaded workbook keeps a plain RangeIndex.
+    """
+
+    def __init__(self, df=None):
+        self.df = df
+        self.dirty_rows = set()
+        self.deleted_rows = set()
+
+    @property
+    def is_from_database(self):
+        return self.df is not None and self.df.index.name == ROWID_COLUMN
+
+    @property
+    def has_unsaved_edits(self):
+        return bool(self.dirty_rows or self.deleted_rows)
+
+    @property
+    def columns(self):
+        return [] if self.df is None else list(self.df.columns)
+
+    def load(self, df):
+        """Replace the data with a new source (a workbook or a fresh read), dropping pending edits."""
+        self.df = df
+        self.dirty_rows.clear()
+        self.deleted_rows.clear()
+
+    def value(self, label, column):
+        return self.df.at[label, column]
+
+    def set_value(self, label, column, text):
+        """Store an edit typed as text; returns False if the value did not actually change."""
+        new_value = self._coerce(column, text)
+        if _same_value(self.df.at[label, column], new_value):
+            return False
+        try:
+            self.df.at[label, column] = new_value
+        except (TypeError, ValueError):
+            # The column cannot hold the new value (e.g. text in an integer column)
+            self.df[column] = self.df[column].astype(object)
+            self.df.at[label, column] = new_value
+        self.dirty_rows.add(label)
+        return True
+
+    def delete_rows(self, labels):
+        self.df = self.df.drop(index=labels)
+        self.dirty_rows.difference_update(labels)
+        self.deleted_rows.update(labels)
+
+    def apply_changes(self, changed_df, deleted_ids):
+        """
+        Merge a row delta read from the database.
+
+        Returns (updated, inserted, deleted) so the caller can patch the view with
+        exactly the rows that moved.
+        """
+        df = self.df
+        deleted = [row_id for row_id in deleted_ids if row_id in df.index]
+        if deleted:
+            df = df.drop(index=deleted)
+        updated = changed_df[changed_df.index.isin(df.index)]
+        inserted = changed_df[~changed_df.index.isin(df.index)]
+        if not changed_df.empty:
+            # Rebuild instead of assigning through .loc so columns can change dtype
+            order = list(df.index) + list(inserted.index)
+            df = pd.concat([df.drop(index=updated.index), changed_df]).reindex(order)
+        self.df = df
+        return updated, inserted, deleted
+
+    def pending_changes(self):
+        """Return (rows_df, deleted_labels) describing everything edited since the last save."""
+        dirty = sorted(self.dirty_rows & set(self.df.index))
+        return self.df.loc[dirty].copy(), sorted(self.deleted_rows)
+
+    def mark_saved(self, saved_rows, deleted_rows):
+        self.dirty_rows.difference_update(saved_rows)
+        self.deleted_rows.difference_update(deleted_rows)
+
+    def to_frame(self):
+        """The data as a plain frame for saving or exporting, without the rowid index."""
+        return self.df.reset_index(drop=True)
+
+    def summary(self):
+        """(column, total) pairs: sums for numeric columns, row counts otherwise."""
+        return [(col, self.df[col].sum() if pd.api.types.is_numeric_dtype(self.df[col]) else len(self.df[col]))
+                for col in self.df.columns]
+
+    def _coerce(self, column, text):
+        if text == '':
+            return None
+        dtype = self.df[column].dtype
+        try:
+            if pd.api.types.is_integer_dtype(dtype):
+                return int(text)
+            if pd.api.types.is_float_dtype(dtype):
+                return float(text)
+        except ValueError:
+            pass
+        return text
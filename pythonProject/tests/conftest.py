@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The app's modules import each other by bare name, as when run from pythonProject
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing database creates user_management.db in the cwd, so do it somewhere disposable
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    import database
+    from database import init_db
+    from query_cache import query_cache
+finally:
+    os.chdir(_cwd)
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """A fresh database in a temporary directory, since init_db works relative to the cwd."""
+    monkeypatch.chdir(tmp_path)
+    # Pooled read connections and cached results are keyed by database name, which every test reuses
+    monkeypatch.setattr(database, "_read_pools", {})
+    monkeypatch.setattr(database, "_version_watchers", {})
+    query_cache.clear()
+    connection = init_db("test")
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def daily_data(conn):
+    conn.execute("CREATE TABLE daily_data (id INTEGER PRIMARY KEY, name TEXT, amount INTEGER)")
+    conn.executemany("INSERT INTO daily_data (id, name, amount) VALUES (?, ?, ?)",
+                     [(1, "apples", 10), (2, "pears", 20), (3, "plums", 30)])
+    conn.commit()
+    return conn
@@ -0,0 +1,72 @@
+import pytest
+from archive import select_retained, archive_backup_partitions
+from database import backup_data, epoch_day, get_snapshot, list_snapshots, restore_snapshot
+
+
+def entries(*stamps):
+    return [{"file": f"archive-{i}", "created_at": stamp} for i, stamp in enumerate(stamps)]
+
+
+def test_grandfather_father_son_retention():
+    archives = entries(
+        "2026-10-18 10:00:00",  # 0: newest of its day, week and month
+        "2026-10-18 09:00:00",  # 1: older copy of the same day
+        "2026-10-17 10:00:00",  # 2: second daily
+        "2026-10-16 10:00:00",  # 3: a third day, same ISO week as 0
+        "2026-10-05 10:00:00",  # 4: newest of the previous week
+        "2026-09-20 10:00:00",  # 5: newest of September
+        "2026-08-01 10:00:00",  # 6: newest of August
+        "2026-07-15 10:00:00",  # 7: a fourth month
+    )
+    keep = select_retained(archives, daily=2, weekly=2, monthly=3)
+    assert keep == {"archive-0", "archive-2", "archive-4", "archive-5", "archive-6"}
+
+
+def test_retention_does_not_depend_on_manifest_order():
+    archives = entries("2026-10-16 10:00:00", "2026-10-18 10:00:00", "2026-10-17 10:00:00")
+    assert select_retained(archives, daily=1, weekly=0, monthly=0) == {"archive-1"}
+
+
+def test_everything_is_kept_while_under_the_limits():
+    archives = entries("2026-10-18 10:00:00", "2026-10-10 10:00:00", "2026-09-01 10:00:00")
+    assert select_retained(archives) == {"archive-0", "archive-1", "archive-2"}
+
+
+def backdate(conn, snapshot_id, day):
+    conn.execute("UPDATE backup_snapshots SET created_at=? WHERE id=?", (f"{day} 12:00:00", snapshot_id))
+    conn.execute('UPDATE backup_data SET "Bkp_Date_time"=?, "Bkp_Day"=? WHERE "Bkp_Snapshot_Id"=?',
+                 (f"{day} 12:00:00", epoch_day(day), snapshot_id))
+    conn.commit()
+
+
+def test_partitioning_archives_snapshots_that_wrote_no_rows(daily_data):
+    pytest.importorskip("pyarrow")
+    conn = daily_data
+    first, _, _ = backup_data(conn, mode="delta")
+    empty_delta, kind, rows_written = backup_data(conn, mode="delta")
+    assert (kind, rows_written) == ("delta", 0)
+    backdate(conn, first, "2020-01-01")
+    backdate(conn, empty_delta, "2020-01-01")
+    conn.execute("UPDATE daily_data SET amount = 11 WHERE id = 1")
+    conn.commit()
+    base, _, _ = backup_data(conn, mode="full")
+    backdate(conn, base, "2020-01-02")
+
+    archive_backup_partitions("test")
+
+    archived = dict(list_snapshots(conn)[["id", "archived"]].itertuples(index=False))
+    assert archived == {first: 1, empty_delta: 1, base: 0}
+    with pytest.raises(ValueError):
+        restore_snapshot(conn, empty_delta)
+    assert conn.execute("SELECT count(*) FROM daily_data").fetchone()[0] == 3
+    assert len(get_snapshot(conn, base)) == 3
+
+
+def test_snapshot_with_an_archived_base_is_refused(daily_data):
+    conn = daily_data
+    base, _, _ = backup_data(conn, mode="delta")
+    delta, _, _ = backup_data(conn, mode="delta")
+    conn.execute("UPDATE backup_snapshots SET archived=1 WHERE id=?", (base,))
+    conn.commit()
+    with pytest.raises(ValueError):
+        get_snapshot(conn, delta)
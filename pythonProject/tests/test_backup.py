@@ -0,0 +1,61 @@
+from database import backup_data, get_snapshot, get_dataframe, list_snapshots
+
+
+def as_text(df):
+    return df[["name", "amount"]].astype(str).sort_index()
+
+
+def test_first_backup_is_full(daily_data):
+    snapshot_id, kind, rows_written = backup_data(daily_data, mode="delta")
+    assert kind == "full"
+    assert rows_written == 3
+    assert list(list_snapshots(daily_data)["id"]) == [snapshot_id]
+
+
+def test_delta_rebuilds_edits_inserts_and_deletes(daily_data):
+    conn = daily_data
+    full_id, _, _ = backup_data(conn, mode="delta")
+    original = get_dataframe(conn, "daily_data", with_rowid=True)
+
+    conn.execute("UPDATE daily_data SET amount = 25 WHERE id = 2")
+    conn.execute("DELETE FROM daily_data WHERE id = 3")
+    conn.execute("INSERT INTO daily_data (id, name, amount) VALUES (4, 'figs', 40)")
+    conn.commit()
+    delta_id, kind, rows_written = backup_data(conn, mode="delta")
+
+    assert kind == "delta"
+    assert rows_written == 3  # two rows written with their contents, one delete marker
+    assert as_text(get_snapshot(conn, delta_id)).equals(as_text(get_dataframe(conn, "daily_data", with_rowid=True)))
+    assert as_text(get_snapshot(conn, full_id)).equals(as_text(original))
+
+
+def test_delta_with_no_changes_writes_nothing(daily_data):
+    full_id, _, _ = backup_data(daily_data, mode="delta")
+    delta_id, kind, rows_written = backup_data(daily_data, mode="delta")
+    assert (kind, rows_written) == ("delta", 0)
+    assert as_text(get_snapshot(daily_data, delta_id)).equals(as_text(get_snapshot(daily_data, full_id)))
+
+
+def test_replacing_the_table_forces_a_full_snapshot(daily_data):
+    backup_data(daily_data, mode="delta")
+    get_dataframe(daily_data, "daily_data").to_sql("daily_data", daily_data, if_exists="replace", index=False)
+    _, kind, rows_written = backup_data(daily_data, mode="delta")
+    assert (kind, rows_written) == ("full", 3)
+
+
+def test_full_mode_replaces_todays_snapshots(daily_data):
+    backup_data(daily_data, mode="delta")
+    snapshot_id, kind, _ = backup_data(daily_data, mode="full")
+    assert kind == "full"
+    assert list(list_snapshots(daily_data)["id"]) == [snapshot_id]
+
+
+def test_default_mode_keeps_a_complete_copy_per_day(daily_data):
+    # Reports and the backup_data export read the stored rows, so the default must be whole copies
+    backup_data(daily_data)
+    daily_data.execute("DELETE FROM daily_data WHERE id = 3")
+    daily_data.commit()
+    _, kind, rows_written = backup_data(daily_data)
+    assert (kind, rows_written) == ("full", 2)
+    rows = daily_data.execute('SELECT "Bkp_Op", count(*) FROM backup_data GROUP BY "Bkp_Op"').fetchall()
+    assert rows == [("U", 2)]
@@ -0,0 +1,43 @@
+from database import backup_data, query_cache_key, read_frame_cached, read_sql_cached
+
+
+def test_log_writes_do_not_invalidate_backup_reports(daily_data):
+    conn = daily_data
+    backup_data(conn)
+    key = query_cache_key("test", "SELECT * FROM backup_data")
+    conn.execute("INSERT INTO logs (username, action) VALUES ('admin', 'Viewed report')")
+    conn.commit()
+    assert query_cache_key("test", "SELECT * FROM backup_data") == key
+    backup_data(conn, mode="delta")
+    assert query_cache_key("test", "SELECT * FROM backup_data") != key
+
+
+def test_daily_data_edits_change_the_key(daily_data):
+    conn = daily_data
+    backup_data(conn)  # installs change tracking
+    key = query_cache_key("test", "SELECT name FROM daily_data WHERE amount > ?", (15,))
+    conn.execute("UPDATE daily_data SET amount = 5 WHERE id = 2")
+    conn.commit()
+    assert query_cache_key("test", "SELECT name FROM daily_data WHERE amount > ?", (15,)) != key
+    assert list(read_sql_cached("test", "SELECT name FROM daily_data WHERE amount > ?", (15,))["name"]) == ["plums"]
+
+
+def test_report_frames_are_reloaded_only_when_backup_data_changes(daily_data):
+    conn = daily_data
+    backup_data(conn)
+    loads = []
+
+    def load(read_conn):
+        loads.append(1)
+        return read_sql_cached("test", "SELECT count(*) AS n FROM backup_data")
+
+    assert read_frame_cached("test", ("report",), ["backup_data"], load)["n"][0] == 3
+    conn.execute("INSERT INTO logs (username, action) VALUES ('admin', 'Viewed report')")
+    conn.commit()
+    read_frame_cached("test", ("report",), ["backup_data"], load)
+    assert len(loads) == 1
+    conn.execute("UPDATE daily_data SET amount = 0")
+    conn.commit()
+    backup_data(conn, mode="delta")
+    assert read_frame_cached("test", ("report",), ["backup_data"], load)["n"][0] == 6
+    assert len(loads) == 2
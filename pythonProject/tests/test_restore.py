@@ -0,0 +1,54 @@
+from change_tracking import tracking_installed
+from database import backup_data, restore_snapshot, get_dataframe
+
+
+def schema(conn):
+    # The table's own CREATE text is compared through table_info, as the rename quotes its name
+    columns = conn.execute("PRAGMA table_info(daily_data)").fetchall()
+    dependents = sorted(conn.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'daily_data' "
+                                     "AND type IN ('index', 'trigger') AND sql IS NOT NULL").fetchall())
+    return columns, dependents
+
+
+def test_restore_round_trip_keeps_schema_and_triggers(daily_data):
+    conn = daily_data
+    conn.execute("CREATE INDEX idx_daily_name ON daily_data (name)")
+    conn.execute("CREATE TABLE audit (name TEXT)")
+    conn.execute("CREATE TRIGGER daily_audit AFTER INSERT ON daily_data "
+                 "BEGIN INSERT INTO audit (name) VALUES (NEW.name); END")
+    conn.commit()
+    snapshot_id, _, _ = backup_data(conn, mode="delta")
+    before_schema = schema(conn)
+    before = get_dataframe(conn, "daily_data", with_rowid=True)
+
+    conn.execute("UPDATE daily_data SET amount = 0")
+    conn.execute("DELETE FROM daily_data WHERE id = 1")
+    conn.execute("INSERT INTO daily_data (id, name, amount) VALUES (9, 'figs', 90)")
+    conn.commit()
+    backup_data(conn, mode="delta")
+
+    assert restore_snapshot(conn, snapshot_id) == 3
+    assert schema(conn) == before_schema
+    assert tracking_installed(conn, "daily_data")
+    assert get_dataframe(conn, "daily_data", with_rowid=True).equals(before)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'daily_data_restore'").fetchone() is None
+
+    # The user's trigger still fires, and the restore started a new change-tracking epoch
+    conn.execute("INSERT INTO daily_data (id, name, amount) VALUES (5, 'kiwis', 50)")
+    conn.commit()
+    assert conn.execute("SELECT name FROM audit").fetchall() == [("figs",), ("kiwis",)]
+    _, kind, rows_written = backup_data(conn, mode="delta")
+    assert (kind, rows_written) == ("full", 4)
+
+
+def test_restore_of_an_emptied_table(daily_data):
+    conn = daily_data
+    conn.execute("DELETE FROM daily_data")
+    conn.commit()
+    empty_id, _, _ = backup_data(conn, mode="delta")
+    conn.execute("INSERT INTO daily_data (id, name, amount) VALUES (7, 'limes', 70)")
+    conn.commit()
+
+    assert restore_snapshot(conn, empty_id) == 0
+    assert conn.execute("SELECT count(*) FROM daily_data").fetchone()[0] == 0
+    assert tracking_installed(conn, "daily_data")
@@ -0,0 +1,21 @@
+from database import get_dataframe, save_row_changes
+
+
+def test_edits_are_updates_by_rowid_that_never_write_the_id(daily_data):
+    conn = daily_data
+    rows = get_dataframe(conn, "daily_data", with_rowid=True).loc[[2]]
+    rows.loc[2, "id"] = 7  # The rowid alias; must not move or duplicate the row
+    rows.loc[2, "amount"] = 21
+    assert save_row_changes(conn, "daily_data", rows, [3]) == []
+    assert conn.execute("SELECT id, name, amount FROM daily_data ORDER BY id").fetchall() == [
+        (1, "apples", 10), (2, "pears", 21)]
+
+
+def test_row_deleted_elsewhere_is_not_brought_back(daily_data):
+    conn = daily_data
+    rows = get_dataframe(conn, "daily_data", with_rowid=True).loc[[1, 2]]
+    rows["amount"] = 0
+    conn.execute("DELETE FROM daily_data WHERE id = 2")
+    conn.commit()
+    assert save_row_changes(conn, "daily_data", rows, []) == [2]
+    assert conn.execute("SELECT id, amount FROM daily_data ORDER BY id").fetchall() == [(1, 0), (3, 30)]
@@ -0,0 +1,57 @@
+import datetime
+import pytest
+from scheduler import BackupScheduler, CronSchedule, load_last_run, parse_cron_field
+
+
+def at(text):
+    return datetime.datetime.fromisoformat(text)
+
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("0 2 * * *", "2026-10-18 01:59:30", "2026-10-18 02:00"),
+    ("0 2 * * *", "2026-10-18 02:00", "2026-10-19 02:00"),
+    ("*/15 9-10 * * *", "2026-10-18 10:50", "2026-10-19 09:00"),
+    ("30 6 * * 7", "2026-10-12 00:00", "2026-10-18 06:30"),  # 7 is Sunday, like 0
+    ("0 0 13 * *", "2026-10-01 00:00", "2026-10-13 00:00"),
+    ("0 0 * * 5", "2026-10-01 00:00", "2026-10-02 00:00"),
+    ("0 0 29 2 *", "2026-10-18 00:00", "2028-02-29 00:00"),
+])
+def test_next_after(expression, after, expected):
+    assert CronSchedule(expression).next_after(at(after)) == at(expected)
+
+
+def test_day_of_month_or_day_of_week_when_both_are_restricted():
+    # Fires on the 13th or on any Friday, as cron does
+    schedule = CronSchedule("0 0 13 * 5")
+    assert schedule.next_after(at("2026-10-01 00:00")) == at("2026-10-02 00:00")  # Friday the 2nd
+    assert schedule.next_after(at("2026-10-09 00:00")) == at("2026-10-13 00:00")  # Tuesday the 13th
+
+
+def test_parse_cron_field():
+    assert parse_cron_field("1-10/3,20", 0, 59) == {1, 4, 7, 10, 20}
+    assert parse_cron_field("*", 1, 12) == set(range(1, 13))
+
+
+@pytest.mark.parametrize("expression", ["0 2 * *", "60 * * * *", "0 0 0 * *", "*/0 * * * *", "5-1 * * * *"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_schedule_that_never_fires():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_after(at("2026-10-18 00:00"))
+
+
+def test_missing_daily_data_skips_the_run_instead_of_retrying(conn):
+    events = []
+    scheduler = BackupScheduler(["test"], jitter=0, on_event=lambda *event: events.append(event[:2]))
+    try:
+        slot = at("2026-10-18 02:00")
+        scheduler._plan("test", slot)
+        scheduler._run("test")
+        assert events == [("test", "running"), ("test", "skipped")]
+        assert scheduler.next_runs()["test"] == scheduler.schedules["test"].next_after(datetime.datetime.now())
+        assert load_last_run("test") == slot
+    finally:
+        scheduler.stop()
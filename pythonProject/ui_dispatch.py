@@ -0,0 +1,91 @@
+import threading
+import time
+import types
+from collections import OrderedDict, deque
+
+FRAME_BUDGET = 0.012  # seconds of Tk-thread work per drain, leaves headroom in a 16 ms frame
+DRAIN_INTERVAL_MS = 16
+
+
+class UIDispatcher:
+    """
+    Queue that lets worker threads hand work to the Tk thread.
+
+    Workers call post() from any thread; the Tk thread drains the queue from
+    root.after in slices of at most FRAME_BUDGET seconds. Posts that share a key
+    coalesce, so only the newest pending update for e.g. a tab is applied. A task
+    may return a generator to spread its work over several slices; posting a new
+    task with the same key cancels a generator that is still running.
+    """
+
+    def __init__(self, root, budget=FRAME_BUDGET, interval_ms=DRAIN_INTERVAL_MS):
+        self.root = root
+        self.budget = budget
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._running = deque()
+        self._closed = False
+        root.after(self.interval_ms, self._drain)
+
+    def post(self, key, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) for the Tk thread. key=None never coalesces."""
+        if key is None:
+            key = object()
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (func, args, kwargs)
+
+    def close(self):
+        self._closed = True
+
+    def _next_pending(self):
+        with self._lock:
+            if not self._pending:
+                return None
+            return self._pending.popitem(last=False)
+
+    def _drain(self):
+        if self._closed:
+            return
+        deadline = time.perf_counter() + self.budget
+        try:
+            while time.perf_counter() < deadline:
+                entry = self._next_pending()
+                if entry is not None:
+                    self._start(*entry)
+                elif self._running:
+                    self._step_running()
+                else:
+                    break
+        finally:
+            self.root.after(self.interval_ms, self._drain)
+
+    def _start(self, key, task):
+        func, args, kwargs = task
+        self._cancel_running(key)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            print(f"Error in UI task {getattr(func, '__name__', func)}: {e}")
+            return
+        if isinstance(result, types.GeneratorType):
+            self._running.append((key, result))
+
+    def _cancel_running(self, key):
+        for running_key, generator in list(self._running):
+            if running_key == key:
+                generator.close()
+                self._running.remove((running_key, generator))
+
+    def _step_running(self):
+        # Round-robin so one long task cannot starve the others
+        key, generator = self._running.popleft()
+        try:
+            next(generator)
+        except StopIteration:
+            return
+        except Exception as e:
+            print(f"Error in UI task: {e}")
+            return
+        self._running.append((key, generator))
@@ -0,0 +1,136 @@
+from tkinter import ttk
+from tab_model import view_rows
+
+MAX_RENDERED_ROWS = 100
+VIRTUAL_THRESHOLD = 5000  # tabs with more rows than this switch to the virtual grid
+DEFAULT_ROW_HEIGHT = 20
+
+
+class VirtualGrid:
+    """
+    Virtual-scrolling view of a DataFrame on top of an existing ttk.Treeview.
+
+    Only a fixed pool of at most MAX_RENDERED_ROWS items ever exists in the
+    Treeview. The grid owns its own scrollbar, sized to the logical row count of
+    the DataFrame, and scrolling just rewrites the values of the pooled items, so
+    display time and Tcl memory stay flat however large the data gets.
+    """
+
+    def __init__(self, tree, max_rendered_rows=MAX_RENDERED_ROWS):
+        self.tree = tree
+        self.max_rendered_rows = max_rendered_rows
+        self.page_size = max_rendered_rows
+        self.df = None
+        self.offset = 0
+        self._items = []
+        self._labels = []
+        self.selected_labels = set()  # selection by DataFrame label, since pooled items show other rows
+
+        self.scrollbar = ttk.Scrollbar(tree.master, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y", before=tree)
+        tree.bind("<MouseWheel>", self._on_mousewheel)
+        tree.bind("<Button-4>", lambda event: self._scroll_by(-3))
+        tree.bind("<Button-5>", lambda event: self._scroll_by(3))
+        tree.bind("<Prior>", lambda event: self._scroll_by(-self.page_size))
+        tree.bind("<Next>", lambda event: self._scroll_by(self.page_size))
+        tree.bind("<Configure>", lambda event: self._fit_page_size())
+        tree.bind("<<TreeviewSelect>>", self._on_select)
+
+    def set_data(self, df, keep_position=False):
+        """Show df, optionally keeping the current scroll offset (used by delta refreshes)."""
+        self.df = df
+        if not keep_position:
+            self.offset = 0
+            self.selected_labels.clear()
+        else:
+            self.selected_labels = {label for label in self.selected_labels if label in df.index}
+        self._clamp_offset()
+        self.render()
+
+    def detach(self):
+        """Remove the pool, bindings and scrollbar so the Treeview can be used normally again."""
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>", "<Prior>", "<Next>", "<Configure>",
+                         "<<TreeviewSelect>>"):
+            self.tree.unbind(sequence)
+        self.tree.delete(*self._items)
+        self._items = []
+        self.scrollbar.destroy()
+
+    def render(self):
+        rows = self.df.iloc[self.offset:self.offset + self.page_size]
+        values = view_rows(rows)
+        items = self._attach_items(len(values))
+        for item_id, row in zip(items, values):
+            self.tree.item(item_id, values=row)
+        self._labels = list(rows.index)
+        # Highlight the items that now show selected rows, wherever those rows moved to
+        self.tree.selection_set([item_id for item_id, label in zip(items, self._labels)
+                                 if label in self.selected_labels])
+
+        total = len(self.df)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(values)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args):
+        """Scrollbar command: handles both 'moveto fraction' and 'scroll n units|pages'."""
+        if not args or self.df is None:
+            return
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.df))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.offset += step * self.page_size if args[2] == "pages" else step
+        self._clamp_offset()
+        self.render()
+
+    def row_label(self, item_id):
+        """Return the DataFrame index label currently shown by a pooled item."""
+        return self._labels[self._items.index(item_id)]
+
+    def _on_select(self, event):
+        # Rows scrolled out of view keep their selection; visible ones follow the tree
+        selected = set(self.tree.selection())
+        visible = dict(zip(self._items, self._labels))
+        visible_labels = set(visible.values())
+        self.selected_labels = ({label for label in self.selected_labels if label not in visible_labels}
+                                | {label for item_id, label in visible.items() if item_id in selected})
+
+    def _attach_items(self, count):
+        while len(self._items) < min(count, self.max_rendered_rows):
+            self._items.append(self.tree.insert("", "end", iid=f"virtual{len(self._items)}"))
+        for index, item_id in enumerate(self._items):
+            if index < count:
+                self.tree.move(item_id, "", index)
+            else:
+                self.tree.detach(item_id)
+        return self._items[:count]
+
+    def _clamp_offset(self):
+        max_offset = max(0, len(self.df) - self.page_size) if self.df is not None else 0
+        self.offset = max(0, min(self.offset, max_offset))
+
+    def _scroll_by(self, rows):
+        if self.df is None:
+            return "break"
+        self.offset += rows
+        self._clamp_offset()
+        self.render()
+        return "break"
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _fit_page_size(self):
+        """Size the pool to the rows that actually fit, so the last rows stay reachable."""
+        row_height = DEFAULT_ROW_HEIGHT
+        header_height = 0
+        if self._items and self.tree.bbox(self._items[0]):
+            _, header_height, _, row_height = self.tree.bbox(self._items[0])
+        visible = max(1, (self.tree.winfo_height() - header_height) // max(1, row_height))
+        page_size = min(visible, self.max_rendered_rows)
+        if page_size != self.page_size and self.df is not None:
+            self.page_size = page_size
+            self._clamp_offset()
+            self.render()